@@ -0,0 +1,255 @@
+"""
+Benchmarks of the simulator, controller and policy hot paths.
+
+Runs on synthetic traces in the DC_pred.csv schema (days of the real trace drawn at random, with day-to-day noise)
+and synthetic sensor profiles, and writes one JSON document per run, so results of two commits can be compared.
+
+    python -m benchmarks.bench --out bench.json
+    python -m benchmarks.bench --quick --out new.json --compare old.json
+
+Measured per case:
+    'startup': Simulator construction from csv (parse), cold binary cache (build) and warm binary cache (hit), seconds
+    'steps_per_s': control steps of Scheduler.start per second
+    'policy_ms': policy decision latency (Policy.run), median / p95 / max, milliseconds
+    'energy': Simulator.load_energy_pred / load_energy_true latency, milliseconds
+    'peak_mb': peak traced memory of the run (tracemalloc), MB
+    'cold_start': one wake-up of the on-device runtime in a fresh process (scheduler.runtime.cold_start), seconds
+"""
+import os, io, sys, json, time, shutil, argparse, platform, tempfile, contextlib, tracemalloc, subprocess
+import numpy as np
+import pandas as pd
+from simulator.EnergySim import Simulator
+from simulator.Timer import Timer, from_epoch
+from simulator.Battery import Battery
+from simulator.trace import Trace
+from scheduler.controller import Scheduler
+from scheduler import runtime
+from scheduler.policy.policy_adap import Policy as policy_adap
+from scheduler.policy.policy_dyna import Policy as policy_dyna
+from scheduler.policy.policy_oracle import Policy as policy_oracle
+
+
+policies = {'policy_dyna': (policy_dyna, 'DynaES'), 'policy_adap': (policy_adap, 'ES-Adap'),
+            'policy_oracle': (policy_oracle, 'Oracle')}
+
+lengths = {'1w': 7, '1m': 30, '3m': 91, '1y': 365}     # trace length, days
+sensor_counts = [4, 16, 64, 256]
+steps = {'hour': None, 'second': 6*3600}              # control steps per run, 'None': whole trace
+
+
+class TimedPolicy:
+    """
+    Policy wrapper that records the latency of every decision.
+    """
+
+    def __init__(self, policy):
+        self.policy = policy
+        self.name = policy.name
+        self.latency = []
+
+
+    def run(self, **kwargs):
+        t = time.perf_counter()
+        nx_sch = self.policy.run(**kwargs)
+        self.latency.append(time.perf_counter() - t)
+        return nx_sch
+
+
+
+def synth_trace(days, src='data/DC_pred.csv', seed=0):
+    """
+    Hourly trace of 'days' days in the schema of 'src': each day is a random day of 'src',
+    its dc columns scaled by a random factor.
+    """
+    rng = np.random.default_rng(seed)
+    base = pd.read_csv(src)
+    rows = 24 * (len(base) // 24)
+    day = rng.integers(0, rows // 24, days)
+    idx = (day[:, None] * 24 + np.arange(24)).ravel()
+    df = base.iloc[idx].reset_index(drop=True)
+    scale = np.repeat(rng.lognormal(0, 0.2, days), 24)
+    for c in df.columns:
+        if c.startswith('dc_'):
+            df[c] = df[c] * scale
+    start = pd.Timestamp(base['Time'].iloc[0])
+    df['Time'] = (start + pd.to_timedelta(np.arange(len(df)), unit='h')).strftime('%Y-%m-%d %H:%M:%S')
+    return df
+
+
+def synth_sensors(n, seed=0):
+    # sensor profile dict of n sensors
+    rng = np.random.default_rng(seed)
+    return {'s%d' % i: {'consum': int(rng.choice([10, 20, 40, 60])), 'ideal_interval': int(rng.choice([1, 2, 3, 6])),
+                        'last_used_time': '2017-06-12T00:00:00', 'time_gap': 1.0, 'priority': 1.0} for i in range(n)}
+
+
+def quantiles(x):
+    x = np.asarray(x) * 1e3
+    if not len(x):
+        return None
+    return {'n': len(x), 'median': float(np.median(x)), 'p95': float(np.percentile(x, 95)), 'max': float(x.max())}
+
+
+def bench_startup(csv_path, repeat=3):
+    # Simulator construction: csv parse, cache build, cache hit
+    res = {}
+    timer = Timer(init_time=pd.Timestamp('2017-06-12'))
+    for case, cache in [('parse', False), ('build', True), ('hit', True)]:
+        if 'build' == case:
+            shutil.rmtree(csv_path + '.trace', ignore_errors=True)
+        t = []
+        for _ in range(1 if 'build' == case else repeat):
+            s = time.perf_counter()
+            Simulator(timer, csv_path, 0.1, 'dc_actual', 'dc_pred_rf', cache=cache)
+            t.append(time.perf_counter() - s)
+        res[case] = min(t)
+    return res
+
+
+def bench_energy(simul, resolution, n=200, seed=0):
+    # load_energy_pred / load_energy_true at random times of the trace
+    rng = np.random.default_rng(seed)
+    step = simul.res_step(resolution)
+    span = max(1, (int(simul.time[-1]) - int(simul.time[0])) // step - 5*24*3600 // step)
+    pred, true = [], []
+    for g in rng.integers(0, span, n):
+        t0 = from_epoch(int(simul.time[0]) + int(g) * step)
+        s = time.perf_counter()
+        simul.load_energy_pred(start=t0, resolution=resolution)
+        pred.append(time.perf_counter() - s)
+        s = time.perf_counter()
+        simul.load_energy_true(start=t0, end=t0 + pd.Timedelta(seconds=step), resolution=resolution)
+        true.append(time.perf_counter() - s)
+    return {'pred': quantiles(pred), 'true': quantiles(true)}
+
+
+def bench_run(trace, sensors, policy, resolution, n_steps=None, event_driven=False, memory=True):
+    """
+    One Scheduler run on 'trace' with the sensor profile dict 'sensors'. Returns the timings of the run.
+    """
+    plc_cls, plc_name = policies[policy]
+    with tempfile.TemporaryDirectory() as tmp:
+        sensor_path = os.path.join(tmp, 'sensor_profile.json')
+
+        def make():
+            with open(sensor_path, 'w') as f:
+                json.dump(sensors, f)
+            timer = Timer(init_time=from_epoch(trace.time[0]))
+            simul = Simulator(timer, None, 0.1, 'dc_actual', 'dc_pred_rf', trace=trace)
+            batt = Battery(soc=2000, capacity=2000, mini=400, standby=24*30*3600, base_consume=30)
+            span = (int(trace.time[-1]) - int(trace.time[0])) // simul.res_step(resolution)
+            duration = span if n_steps is None else min(n_steps, span)
+            plc = TimedPolicy(plc_cls(plc_name))
+            sch = Scheduler(simulator=simul, sensor_path=sensor_path, sch_path=None, battery=batt, policy=plc,
+                            duration=duration, resolution=resolution, event_driven=event_driven)
+            if 'policy_oracle' == policy:
+                plc.policy.end = sch.end            # plan until the end of the run
+            return sch, plc
+
+        sch, plc = make()
+        t = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):      # policy warnings
+            sch.start()
+        wall = time.perf_counter() - t
+        res = {'steps': sch.steps, 'wall_s': wall, 'steps_per_s': sch.steps / wall, 'decisions': len(plc.latency),
+               'policy_ms': quantiles(plc.latency), 'final_soc': float(sch.batt.soc)}
+
+        if memory:      # separate run, tracemalloc slows the run down
+            sch, plc = make()
+            tracemalloc.start()
+            with contextlib.redirect_stdout(io.StringIO()):
+                sch.start()
+            res['peak_mb'] = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+    return res
+
+
+def cases(quick=False):
+    # (trace length, sensors, policy, resolution): trace length sweep at 4 sensors, sensor sweep at 1 month
+    lens = ['1w', '1m'] if quick else list(lengths)
+    counts = [4, 64] if quick else sensor_counts
+    res = []
+    for policy in policies:
+        for resolution in steps:
+            res += [(l, 4, policy, resolution) for l in lens]
+            res += [('1m', n, policy, resolution) for n in counts if n != 4]
+    return res
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run_all(quick=False, memory=True, event_driven=False, second_steps=None):
+    second_steps = second_steps or (3600 if quick else steps['second'])
+    out = {'meta': {'commit': git_commit(), 'time': pd.Timestamp.now().isoformat(), 'python': platform.python_version(),
+                    'numpy': np.__version__, 'pandas': pd.__version__, 'machine': platform.machine(),
+                    'quick': quick, 'event_driven': event_driven},
+           'startup': {}, 'energy': {}, 'cold_start': {}, 'runs': []}
+    with tempfile.TemporaryDirectory() as tmp:
+        for policy in runtime.policies:      # on-device policies, the oracle is offline only
+            state_path = os.path.join(tmp, 'state_%s.json' % policy)
+            runtime.init_state(state_path, 'data/DC_pred.csv', 'data/sensor_profile.json', policy=policy)
+            out['cold_start'][policy] = runtime.cold_start(state_path, repeat=3 if quick else 10)
+            print('cold start', policy, out['cold_start'][policy], flush=True)
+
+        traces = {}
+        for name in sorted({c[0] for c in cases(quick)}, key=lambda x: lengths[x]):
+            csv_path = os.path.join(tmp, 'trace_%s.csv' % name)
+            synth_trace(lengths[name]).to_csv(csv_path, index=False)
+            out['startup'][name] = bench_startup(csv_path)
+            traces[name] = Trace.cached(csv_path)
+            simul = Simulator(Timer(init_time=from_epoch(traces[name].time[0])), None, 0.1, 'dc_actual', 'dc_pred_rf', trace=traces[name])
+            out['energy'][name] = {r: bench_energy(simul, r, n=50 if quick else 200) for r in steps}
+            print('startup/energy', name, out['startup'][name], flush=True)
+
+        for length, n, policy, resolution in cases(quick):
+            n_steps = second_steps if 'second' == resolution else steps[resolution]
+            r = bench_run(traces[length], synth_sensors(n), policy, resolution, n_steps=n_steps, event_driven=event_driven, memory=memory)
+            r.update({'trace': length, 'sensors': n, 'policy': policy, 'resolution': resolution})
+            out['runs'].append(r)
+            print('%-11s %-6s %3s %3d sensors: %9.0f steps/s, policy median %.3f ms' % (policy, resolution, length, n, r['steps_per_s'],
+                  r['policy_ms']['median'] if r['policy_ms'] else float('nan')), flush=True)
+    return out
+
+
+def compare(old, new):
+    # steps/s and policy latency of two results, matched by case
+    key = lambda r: (r['policy'], r['resolution'], r['trace'], r['sensors'])
+    old_runs = {key(r): r for r in old['runs']}
+    rows = []
+    for r in new['runs']:
+        o = old_runs.get(key(r))
+        if o is None:
+            continue
+        rows.append(dict(zip(['policy','resolution','trace','sensors'], key(r)),
+                         steps_per_s_old=o['steps_per_s'], steps_per_s_new=r['steps_per_s'],
+                         speedup=r['steps_per_s'] / o['steps_per_s'],
+                         policy_ms_old=(o['policy_ms'] or {}).get('median'), policy_ms_new=(r['policy_ms'] or {}).get('median')))
+    return pd.DataFrame(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the simulator, controller and policies')
+    parser.add_argument('--out', default='bench.json', help='result json')
+    parser.add_argument('--quick', action='store_true', help='short traces and few cases')
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc run')
+    parser.add_argument('--event-driven', action='store_true', help='run the controller in event-driven mode')
+    parser.add_argument('--second-steps', type=int, default=None, help='control steps of the second resolution runs')
+    parser.add_argument('--compare', default=None, help='earlier result json to compare against')
+    args = parser.parse_args(argv)
+
+    out = run_all(quick=args.quick, memory=not args.no_memory, event_driven=args.event_driven, second_steps=args.second_steps)
+    with open(args.out, 'w') as f:
+        json.dump(out, f, indent=1)
+    print('-> %s' % args.out)
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            print(compare(json.load(f), out).to_string(index=False))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
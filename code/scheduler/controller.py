@@ -1,13 +1,21 @@
-import json, ast
 import pandas as pd
+from simulator.Timer import to_epoch, from_epoch, seconds
+from scheduler.schlog import SchLog
+from scheduler.sensors import SensorStore
+from scheduler.instrument import NullInstrument
+from scheduler.snapshot import Snapshot
 
 
 class Scheduler:
     """
     Variables: 
         1. resolution is the time period we want to increase after each schedule. Unit: second.
-            '1': 1 second
-            'None': jump to next schedule time
+            'hour': 1 hour
+            'second': 1 second
+            'None': jump to next schedule time, i.e. 'hour' with event_driven
+
+        event_driven: jump straight to the next schedule time or soc threshold crossing instead of stepping
+            through every hour/second. Same final soc and log as the per-step run (up to float rounding).
 
         2. sch_columns: 
             'policy': policy
@@ -18,100 +26,113 @@ class Scheduler:
             'exed': if schedule is executed
             'exe_time': execute time. values:['second','hour']
             'info': log
+
+        3. flush_every: number of finished schedules buffered in memory before they are appended to sch_path.
+            'None': schedule log and sensor profile are written at the end of the run only
+            sch_path 'None': keep the schedule log in memory only
+
+        4. sensors: SensorStore loaded from sensor_path, written back to it only at checkpoints and at the end of the run
+
+        5. instrument: Instrument recording phase times, policy latency and bytes written, see scheduler.instrument.
+            'None': nothing is recorded
+
+        6. snapshot() / fork(): state of the run at the current time and independent branches from it, see scheduler.snapshot
+
+        7. time: the run keeps times as epoch seconds (timer.now, 'end', 'step'); timestamps are made only at the API
+            (simul_end_time, timer.curr_time) and when the log is exported
     """
+    step_sizes = {'hour': 3600, 'second': 1}     # resolution -> step, second
     
-    def __init__(self, simulator, sensor_path, sch_path, battery, policy=None, duration=7*24, resolution=None):
+    def __init__(self, simulator, sensor_path, sch_path, battery, policy=None, duration=7*24, resolution=None, flush_every=None, event_driven=False, instrument=None):
         
         self.sch_columns = ['policy','schd_time','sensors','start_soc','end_soc','exed','exe_time','priority','info']    # all infos need to log
         self.sensor_path = sensor_path
         self.sensors = self.load_sensor(sensor_path)
         self.duration = duration
         self.sch_path = sch_path
+        self.flush_every = flush_every
         self.sch = self.load_sch(sch_path)
         self.next_sch = None
         self.simulator = simulator
         self.timer = self.simulator.timer
         self.plc = policy
         self.batt = battery
+        if resolution is None:
+            resolution, event_driven = 'hour', True
         self.resolution = resolution
-        self.simul_end_time = self.simul_end(self.resolution, self.duration)
+        self.event_driven = event_driven
+        self.step = self.step_sizes.get(resolution)
+        self.steps = 0                      # control steps done
+        self.inst = instrument or NullInstrument()
+        self.end = self.simul_end(self.resolution, self.duration)     # last step, epoch second
         
         
     def load_sensor(self, sensor_file):
         # load sensor profile
-        with open(sensor_file, "r") as f:
-            loaded_dict = json.load(f)
-        return loaded_dict
+        return SensorStore.load(sensor_file)
     
     
     def load_sch(self, sch_path):
-        # load schedule file to dataframe
-        try:
-            df = pd.read_csv(sch_path,parse_dates=['schd_time','exe_time'],dtype={'policy':str,'exed':bool})
-            df['sensors'] = df['sensors'].apply(lambda x: ast.literal_eval(x) if isinstance(x,str) else x)
-            df['priority'] = df['priority'].apply(lambda x: ast.literal_eval(x) if isinstance(x,str) else x)
-            df['info'] = df['info'].apply(lambda x: ast.literal_eval(x) if isinstance(x,str) else x)
-        except:
-            df = pd.DataFrame([],columns=self.sch_columns)
-            df.to_csv(sch_path, index=False)
-        
-        return df
-    
-    
-    def save_df(self, df, path):
-        df.to_csv(path, index=False)
-        return df
+        # load schedule file to an in-memory log
+        if sch_path is None:
+            return SchLog(self.sch_columns, sensors=self.sensors)
+        return SchLog.load(sch_path, self.sch_columns, sensors=self.sensors, flush_every=self.flush_every)
     
     
     def simul_end(self, resolution, duration):
-        # cal end time for simulation
+        # cal end time for simulation, epoch second
         if 'hour' in resolution:
-            simul_end_input = self.timer.init_time + pd.Timedelta(hours=duration)
+            simul_end_input = self.timer.start + duration * 3600
         elif 'second' in resolution:
-            simul_end_input = self.timer.init_time + pd.Timedelta(seconds=duration)
-        self.simulator.load_energy_pred(resolution=resolution)      # prepare energy data
-        nearest_end = min( simul_end_input, self.simulator.energy_hour.index[-1] )
+            simul_end_input = self.timer.start + duration
+        nearest_end = min( int(simul_end_input), int(self.simulator.time[-1]) )
         return nearest_end
     
     
+    @property
+    def simul_end_time(self):
+        return from_epoch(self.end)
+    
+    
     def reset_prior(self, curr_time, tgt, sensors):
         # reset sensors prio to 0
-        for s in tgt:
-            sensors[s]['last_used_time'] = curr_time.isoformat()
-            sensors[s]['time_gap'] = 1
-            sensors[s]['priority'] = 1
+        sensors.reset_prior(to_epoch(curr_time), tgt)
         return sensors
     
     
     def update_prior(self, curr_time, sensors):
         # update prior
-        for s in sensors.keys():
-            gap = 1+ (curr_time-pd.to_datetime(sensors[s]['last_used_time'])).total_seconds() /3600
-            sensors[s]['time_gap'] = gap
-            sensors[s]['priority'] = abs(gap / sensors[s]['ideal_interval'])    # priority formula
-            
+        sensors.update_prior(to_epoch(curr_time))     # all sensors at once, see SensorStore.update_prior
         return sensors
         
         
     def save_sensor(self, sensor, sensor_file):
-        # save sensor profile
-        for s in sensor.keys():
-            if isinstance(sensor[s]['last_used_time'], pd.Timestamp):
-                sensor[s]['last_used_time'] = sensor[s]['last_used_time'].isoformat()
-        with open(sensor_file, "w") as f:
-            json.dump(sensor,f)
-        return None
+        # save sensor profile, returns bytes written
+        return sensor.save(sensor_file)
+    
     
-              
-    def save_df(self, df, path):
-        # save next schedule to file
-        df.to_csv(path, header=True, index=False)
+    def checkpoint(self, final=False):
+        # persist schedule log and sensor profile
+        self.inst.add_io('sch_log', self.sch.flush(final=final))
+        if self.sensor_path:
+            self.inst.add_io('sensor_profile', self.save_sensor(self.sensors, self.sensor_path))
+        
         
+    def snapshot(self):
+        # cheap copy of the run state, see scheduler.snapshot
+        return Snapshot(self)
+    
+    
+    def fork(self, **kwargs):
+        # independent branch from the current state, see Snapshot.fork
+        return self.snapshot().fork(**kwargs)
         
         
     def run_policy(self, battery, timer, sensors, simulator, policy, resolution, sch):
         # run policy kernel
+        t = self.inst.now()
         sch = policy.run(sensor_profile=sensors, timer=timer, simulator=simulator, battery=battery, resolution=resolution, sch=self.sch)
+        self.inst.decision(t)
         return sch
         
         
@@ -119,80 +140,146 @@ class Scheduler:
         """
         Schedule generator
         """
-        nx_sch_df = pd.DataFrame()   # next schedule in dataframe format
         if 'hour'==self.resolution:       # time increase by hour
             nx_sch = self.run_policy(self.batt, self.timer, self.sensors, self.simulator, self.plc, resolution=self.resolution, sch=self.sch)
             #nx_sch = self.run_policy(self.batt, self.timer, self.sensors, self.simulator.load_energy_pred(resolution=self.resolution), self.plc, resolution=self.resolution, sch=self.sch)
-            nx_sch['time'] = self.timer.curr_time + pd.Timedelta(hours=nx_sch['time'])
+            nx_sch['time'] = self.timer.now + int(nx_sch['time'] * 3600)
         elif 'second'==self.resolution:   # time increase by second
-            nx_sch = self.run_policy(self.batt, self.timer, self.sensors, self.simulator.load_energy_pred(resolution=self.resolution), self.plc, resolution=self.resolution)
-            nx_sch['time'] = self.timer.curr_time + pd.Timedelta(seconds=nx_sch['time'])
+            nx_sch = self.run_policy(self.batt, self.timer, self.sensors, self.simulator, self.plc, resolution=self.resolution, sch=self.sch)
+            nx_sch['time'] = self.timer.now + int(nx_sch['time'])
         else:
             print("resolution not recognized. ['hour','second']")
         
-        nx_sch_df = pd.DataFrame([[self.plc.name,nx_sch['time'],nx_sch['sensors'],pd.NA,pd.NA,False,pd.NA,pd.NA,[]]], columns=self.sch_columns)
+        nx_sch_row = dict(zip(self.sch_columns, [self.plc.name,nx_sch['time'],nx_sch['sensors'],pd.NA,pd.NA,False,pd.NA,pd.NA,[]]))
         
-        return nx_sch_df
+        return nx_sch_row
         
         
         
-    def start(self):
-        #self.simulator.load_energy_pred(resolution=self.resolution)  # load data
-        while self.timer.curr_time <= self.simul_end_time:      # simulating makespan
-            
-            # init var
-            info = []
-            start_soc = self.batt.soc
+    def control(self):
+        """
+        One control step at the current time: read sch, exe sch, update prior, sch next.
+        """
+        # init var
+        info = []
+        start_soc = self.batt.soc
+        now = self.timer.now
+        self.steps += 1
+        
+        # 1. read sch
+        if self.sch.empty:       # if init sch is empty, create one
+            self.sensors = self.update_prior(now, self.sensors)
+            self.sch.append(self.sch_gen())
+            self.sch.set_tail('schd_time', now)
+        last_sch = self.sch.tail(['policy','schd_time','sensors','exed'], raw=True)    # read last sch from log
+        
+        if self.plc.name != last_sch['policy']:        # if new policy in, continue
+            self.sch.append(self.sch_gen())
+            self.sch.set_tail('schd_time', now)
+        self.inst.lap('read')
+
+        # 2. exe sch
+        if (not last_sch['exed']) and (last_sch['schd_time']<=now):   # not exed, time ok
             
-            # 1. read sch
-            if self.sch.empty:       # if init sch is empty, create one
-                self.sensors = self.update_prior(self.timer.curr_time, self.sensors)
-                self.sch = self.sch_gen()
-                self.sch['schd_time'] = self.timer.curr_time
-            last_sch = self.sch.iloc[self.sch.tail(1).index.values[0],:]    # read last sch from file
+            # 2.1 exe sch
+            tot_drain = self.sensors.total_consum(last_sch['sensors']) + self.batt.base_consume     # drain batt: sensors + pi(next bootup)
             
-            if self.plc.name != last_sch['policy']:        # if new policy in, continue
-                self.sch = pd.concat([self.sch,self.sch_gen()], ignore_index=True)
-                self.sch.loc[self.sch.tail(1).index.values[0],'schd_time'] = self.timer.curr_time
-
-            # 2. exe sch
-            if (not last_sch['exed']) and (last_sch['schd_time']<=self.timer.curr_time):   # not exed, time ok
+            # 2.2 check batt
+            if (self.batt.soc - tot_drain) > 0:      # if soc is enough
+                self.batt.drain( tot_drain )
+                self.sch.set_tail('exed', True)    # mark sch exe-ed
+                self.sch.set_tail('start_soc', float(start_soc))
+                self.sch.set_tail('end_soc', float(self.batt.soc))
+                self.sch.set_tail('exe_time', now + 1)
+                self.sensors = self.reset_prior(now, last_sch['sensors'], self.sensors)   # reset exe-ed prior
                 
-                # 2.1 exe sch
-                tot_drain = sum([self.sensors[s]['consum'] for s in last_sch['sensors']]) + self.batt.base_consume     # drain batt: sensors + pi(next bootup)
+            else:
+                info.append('soc not enough')   # log failure
+                self.sch.set_tail('info', self.sch.get('info') + info)
+        self.inst.lap('execute')
                 
-                # 2.2 check batt
-                if (self.batt.soc - tot_drain) > 0:      # if soc is enough
-                    self.batt.drain( tot_drain )
-                    self.sch.loc[self.sch.tail(1).index.values[0],'exed'] = True    # mark sch exe-ed
-                    self.sch.loc[self.sch.tail(1).index.values[0],'start_soc'] = start_soc
-                    self.sch.loc[self.sch.tail(1).index.values[0],'end_soc'] = self.batt.soc
-                    self.sch.loc[self.sch.tail(1).index.values[0],'exe_time']=self.timer.curr_time+pd.Timedelta(seconds=1)
-                    self.sensors = self.reset_prior(self.timer.curr_time, last_sch['sensors'], self.sensors)   # reset exe-ed prior
-                    
-                else:
-                    info.append('soc not enough')   # log failure
-                    
-            # 3. update prior
-            self.sensors = self.update_prior(self.timer.curr_time, self.sensors)   # update all prior
-            self.sch.loc[self.sch.tail(1).index.values[-1],'priority'] = str(self.sensors)
+        # 3. update prior
+        self.sensors = self.update_prior(now, self.sensors)   # update all prior
+        self.sch.set_tail('priority', self.sensors)       # snapshot of the sensor profile
+        self.inst.lap('update_prior')
+        
+        # 4. sch next
+        if self.sch.get('exed'):       # sch exed
+            self.sch.append(self.sch_gen())          # sch next
+            self.inst.lap('sch_gen')
+            if self.sch.due():
+                self.checkpoint()                    # save sch in batches
+                self.inst.lap('persist')
+        
+        
+    def jump(self, n, time_step=None, drain=None, block=None):
+        """
+        Charge and leak over n steps at once, in closed form (Battery.project), and move the timer.
+        With 'drain', stop at the first step where soc - drain > 0. Returns the number of steps done.
+        'time_step': seconds or timedelta, default the resolution's step.
+        """
+        time_step = self.step if time_step is None else int(seconds(time_step))
+        block = block or (3*24*3600 // time_step)     # at most 3 days of steps per array
+        done = 0
+        while done < n:
+            m = min(block, n - done)
+            gains = self.simulator.load_energy_steps(self.timer.now, m, resolution=self.resolution)
+            socs = self.batt.project(gains, time_step)
+            if drain is not None and ((socs - drain) > 0).any():
+                m = int(((socs - drain) > 0).argmax()) + 1
+                n = done + m
+            self.batt.settle(gains[:m], socs[m-1], time_step)
+            self.timer.forward( time_step * m )
+            done += m
+        self.inst.lap('charge_leak')
+        return done
+        
+        
+    def start(self):
+        with self.inst.profiling():
+            self.inst.begin()
+            if self.event_driven:
+                return self.start_event()
             
-            # 4. sch next
-            nx_sch_df = None
-            if self.sch.tail(1)['exed'].values[0]:       # sch exed
-                nx_sch_df = self.sch_gen()               # sch next
-                self.sch = pd.concat([self.sch, nx_sch_df], ignore_index=True)
-                self.save_df(self.sch, self.sch_path)           # save sch
+            time_step = self.step
+            while self.timer.now <= self.end:      # simulating makespan
+                self.control()
+                
+                # 5. time +
+                now = self.timer.now
+                self.batt.charge( self.simulator.load_energy_true(start=now, end=now+time_step, resolution=self.resolution)[0] )   # charge batt with GT energy
+                self.batt.leak( time_step )           # battery leak
+                self.timer.forward( time_step )       # time increase
+                self.inst.lap('charge_leak')
             
-            # 5. time +
-            if ('hour'==self.resolution) or (None==self.resolution):
-                time_step = pd.Timedelta(hours=1)    #nx_sch_df['schd_time'].values[0]
-            elif 'second'==self.resolution:
-                time_step = pd.Timedelta(seconds=1)
+            self.checkpoint(final=True)
+            self.inst.lap('persist')
+        
+        
+    def start_event(self):
+        """
+        Discrete-event run: control only at the steps where something can happen, i.e. the next schedule time,
+        the first step after it with enough soc, and the last step. Charge and leak in between are done by jump().
+        """
+        time_step = self.step
+        left = (self.end - self.timer.now) // time_step      # steps until the last one
+        while left >= 0:
+            self.control()
+            if 0 == left:
+                self.jump(1, time_step)
+                break
             
-            self.batt.charge( self.simulator.load_energy_true(start=self.timer.curr_time, end=self.timer.curr_time+time_step, resolution=self.resolution)[0] )   # charge batt with GT energy
-            self.batt.leak( time_step )           # battery leak
-            self.timer.forward( time_step )       # time increase
-            self.save_sensor(self.sensors, self.sensor_path)
+            # jump to the next schedule time
+            last_sch = self.sch.tail(['schd_time','sensors'], raw=True)
+            due = max(1, -((self.timer.now - last_sch['schd_time']) // time_step))
+            n = self.jump(min(due, left), time_step)
+            left -= n
             
-            
\ No newline at end of file
+            # not enough soc on time: jump to the first step with enough soc
+            tot_drain = self.sensors.total_consum(last_sch['sensors']) + self.batt.base_consume
+            if n == due and left > 0 and not (self.batt.soc - tot_drain) > 0:
+                self.sch.set_tail('info', self.sch.get('info') + ['soc not enough'])   # log failure, as control() would
+                left -= self.jump(left, time_step, drain=tot_drain)
+        
+        self.checkpoint(final=True)
+        self.inst.lap('persist')
@@ -0,0 +1,180 @@
+import numpy as np
+import pandas as pd
+from simulator.Timer import to_epoch, from_epoch
+
+
+class FleetSensors:
+    """
+    Sensor profiles of N nodes as (N, S) arrays over the union of sensor names.
+    Variables:
+        'names': sensor names (S,)
+        'has': node carries the sensor
+        'consum', 'ideal_interval': sensor profile
+        'last_used': last used time, epoch second
+        'time_gap', 'priority': same as the sensor profile dict, see Scheduler.update_prior
+    """
+
+    def __init__(self, names, has, consum, ideal_interval, last_used):
+        self.names = list(names)
+        self.has = np.asarray(has, dtype=bool)
+        self.consum = np.where(self.has, consum, 0).astype(float)
+        self.ideal_interval = np.where(self.has, ideal_interval, 1).astype(float)
+        self.last_used = np.asarray(last_used, dtype=np.int64)
+        self.time_gap = np.ones(self.has.shape)
+        self.priority = np.where(self.has, 1.0, 0.0)
+
+
+    @classmethod
+    def from_profiles(cls, profiles):
+        # list of sensor profile dicts (one per node) -> arrays
+        names = []
+        for p in profiles:
+            names += [s for s in p if s not in names]
+        n, m = len(profiles), len(names)
+        has, consum, ideal, last = np.zeros((n,m), dtype=bool), np.zeros((n,m)), np.ones((n,m)), np.zeros((n,m), dtype=np.int64)
+        for i, p in enumerate(profiles):
+            for j, s in enumerate(names):
+                if s in p:
+                    has[i,j], consum[i,j], ideal[i,j] = True, p[s]['consum'], p[s]['ideal_interval']
+                    last[i,j] = to_epoch(p[s]['last_used_time'])
+        return cls(names, has, consum, ideal, last)
+
+
+    def __len__(self):
+        return len(self.has)
+
+
+    def update_prior(self, curr, idx=slice(None)):
+        # same formula as Scheduler.update_prior, for the selected nodes
+        gap = 1 + (curr - self.last_used[idx]) / 3600
+        self.time_gap[idx] = gap
+        self.priority[idx] = np.where(self.has[idx], np.abs(gap / self.ideal_interval[idx]), 0)
+
+
+    def reset_prior(self, curr, idx, used):
+        # used: (len(idx), S) mask of sensors that ran
+        last = self.last_used[idx]
+        last[used] = curr
+        self.last_used[idx] = last
+
+
+
+class FleetScheduler:
+    """
+    Vectorized Scheduler for N nodes sharing one energy trace.
+    Battery SOC, leak, charge/drain clipping and sensor priorities of all nodes are arrays advanced together each step,
+    and the policy decides for all nodes whose schedule ran in one batched call (policy.run_batch).
+
+    Variables:
+        1. 'battery': FleetBattery
+        2. 'sensors': FleetSensors
+        3. 'panel': solar panel size of each node relative to the simulator's dc_alpha, shape (N,) or scalar
+        4. 'resolution', 'duration': see Scheduler
+        5. 'record_soc': keep the SOC of every node at every step (steps x N)
+
+    Executed schedules are logged as arrays: node, schd_time, exe_time, start_soc, end_soc, sensors (mask).
+    """
+
+    def __init__(self, simulator, sensors, battery, policy, panel=1.0, duration=7*24, resolution='hour', record_soc=False):
+        self.simulator = simulator
+        self.timer = simulator.timer
+        self.sensors = sensors
+        self.batt = battery
+        self.plc = policy
+        self.n = len(battery)
+        self.panel = np.broadcast_to(np.asarray(panel, dtype=float), (self.n,)).copy()
+        self.duration = duration
+        self.resolution = resolution
+        self.step = {'hour': 3600, 'second': 1}[resolution]
+        self.end = min(self.timer.start + duration*self.step, int(self.simulator.time[-1]))    # last step, epoch second
+        self.record_soc = record_soc
+
+        self.next_time = np.full(self.n, self.timer.now, dtype=np.int64)   # pending schedule time
+        self.next_sensors = np.zeros(self.sensors.has.shape, dtype=bool)                   # pending schedule sensors
+        self.log = {c: [] for c in ['node','schd_time','exe_time','start_soc','end_soc','sensors']}
+        self.failed = np.zeros(self.n, dtype=np.int64)        # steps a due schedule could not run: soc not enough
+        self.soc_trace = []
+
+
+    def sch_gen(self, idx):
+        # next schedule for the selected nodes
+        curr = self.timer.now
+        self.sensors.update_prior(curr, idx)
+        nx_sch = self.plc.run_batch(timer=self.timer, battery=self.batt, sensors=self.sensors, simulator=self.simulator,
+                                    resolution=self.resolution, idx=idx, panel=self.panel[idx])
+        self.next_time[idx] = curr + np.asarray(nx_sch['time'] * self.step, dtype=np.int64)
+        self.next_sensors[idx] = nx_sch['sensors']
+
+
+    def start(self):
+        time_step = self.step
+        all_nodes = np.arange(self.n)
+        self.sch_gen(all_nodes)                                  # init sch, run right away
+        self.next_time[:] = self.timer.now
+
+        while self.timer.now <= self.end:
+            curr = self.timer.now
+
+            # 1. due schedules
+            due = np.flatnonzero(self.next_time <= curr)
+            if len(due):
+                used = self.next_sensors[due]
+                tot_drain = (used * self.sensors.consum[due]).sum(axis=1) + self.batt.base_consume[due]
+                ok = (self.batt.soc[due] - tot_drain) > 0
+                self.failed[due[~ok]] += 1
+                exe, used, tot_drain = due[ok], used[ok], tot_drain[ok]
+
+                # 2. exe sch
+                if len(exe):
+                    start_soc = self.batt.soc[exe]
+                    self.batt.drain(tot_drain, exe)
+                    self.sensors.reset_prior(curr, exe, used)
+                    for c, v in zip(self.log, [exe, self.next_time[exe], np.full(len(exe), curr+1), start_soc, self.batt.soc[exe], used]):
+                        self.log[c].append(v)
+
+                    # 3. sch next, one batched policy call
+                    self.sch_gen(exe)
+
+            # 4. time +
+            gain = self.simulator.load_energy_true(start=curr, end=curr+time_step, resolution=self.resolution)[0]
+            self.batt.charge(gain * self.panel)
+            self.batt.leak(time_step)
+            if self.record_soc:
+                self.soc_trace.append(self.batt.soc.astype(np.float32))
+            self.timer.forward(time_step)
+
+        return self.summary()
+
+
+    @property
+    def simul_end_time(self):
+        return from_epoch(self.end)
+
+
+    def to_df(self):
+        # executed schedules of all nodes
+        if not self.log['node']:
+            return pd.DataFrame(columns=list(self.log))
+        cols = {c: np.concatenate(v) for c, v in self.log.items()}
+        names = np.array(self.sensors.names)
+        df = pd.DataFrame({'node': cols['node'],
+                           'schd_time': pd.to_datetime(cols['schd_time'], unit='s'),
+                           'exe_time': pd.to_datetime(cols['exe_time'], unit='s'),
+                           'start_soc': cols['start_soc'],
+                           'end_soc': cols['end_soc'],
+                           'sensors': [list(names[m]) for m in cols['sensors']]})
+        return df.sort_values(['node','exe_time'], kind='stable').reset_index(drop=True)
+
+
+    def summary(self):
+        # per-node totals
+        res = pd.DataFrame({'node': np.arange(self.n), 'final_soc': self.batt.soc, 'failed': self.failed,
+                            'panel': self.panel, 'capacity': self.batt.capacity, 'clipped': self.batt.clipped})
+        res['executed'] = 0
+        if self.log['node']:
+            node = np.concatenate(self.log['node'])
+            used = np.concatenate(self.log['sensors'])
+            res['executed'] = np.bincount(node, minlength=self.n)
+            for j, s in enumerate(self.sensors.names):
+                res['sensing_'+s] = np.bincount(node, weights=used[:,j], minlength=self.n).astype(np.int64)
+        return res
@@ -0,0 +1,164 @@
+import time, bisect, contextlib
+
+
+class Instrument:
+    """
+    Phase timing, policy latency and I/O counters of a run.
+    The controller marks the end of each phase with lap(name): the time since the previous lap is added to 'name'.
+    Phases of Scheduler: 'read', 'execute', 'update_prior', 'sch_gen', 'persist', 'charge_leak'.
+
+    Variables:
+        'phases': phase -> [seconds, count]
+        'latency_edges': upper bin edges of the policy latency histogram, seconds. Slower decisions go to the last bin
+        'io': target -> bytes written
+        'hooks': callbacks fn(event, name, value), event in ['phase', 'decision', 'io']
+        'profile': capture a cProfile of the run (see profiling / profile_stats)
+
+    Scheduler(instrument=None) uses NullInstrument, whose methods do nothing.
+    """
+
+    enabled = True
+
+    def __init__(self, profile=False, latency_edges=None):
+        self.phases = {}
+        self.latency_edges = latency_edges or [10**(e/4) * 1e-6 for e in range(0, 29)]     # 1us .. 10s, 4 bins per decade
+        self.latency_counts = [0] * (len(self.latency_edges) + 1)
+        self.latency_sum = 0.0
+        self.decisions = 0
+        self.io = {}
+        self.hooks = []
+        self.profile = profile
+        self.profiler = None
+        self.last = time.perf_counter()
+
+
+    now = staticmethod(time.perf_counter)
+
+
+    def add_hook(self, fn):
+        self.hooks.append(fn)
+        return fn
+
+
+    def begin(self):
+        # start the first phase now
+        self.last = time.perf_counter()
+
+
+    def lap(self, name):
+        t = time.perf_counter()
+        dt = t - self.last
+        self.last = t
+        p = self.phases.get(name)
+        if p is None:
+            p = self.phases[name] = [0.0, 0]
+        p[0] += dt
+        p[1] += 1
+        for fn in self.hooks:
+            fn('phase', name, dt)
+
+
+    def decision(self, t0):
+        # one policy decision started at t0 (now())
+        dt = time.perf_counter() - t0
+        self.decisions += 1
+        self.latency_sum += dt
+        self.latency_counts[bisect.bisect_left(self.latency_edges, dt)] += 1
+        for fn in self.hooks:
+            fn('decision', None, dt)
+
+
+    def add_io(self, target, nbytes):
+        self.io[target] = self.io.get(target, 0) + (nbytes or 0)
+        for fn in self.hooks:
+            fn('io', target, nbytes)
+
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        # time a block of user code as its own phase, the time since the previous lap is not counted
+        self.last = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.lap(name)
+
+
+    @contextlib.contextmanager
+    def profiling(self):
+        # cProfile around a run, if asked
+        if not self.profile:
+            yield self
+            return
+        import cProfile
+        self.profiler = self.profiler or cProfile.Profile()
+        self.profiler.enable()
+        try:
+            yield self
+        finally:
+            self.profiler.disable()
+
+
+    def profile_stats(self, n=20, sort='cumulative'):
+        # top n functions of the captured profile, as text
+        if self.profiler is None:
+            return ''
+        import io, pstats
+        out = io.StringIO()
+        pstats.Stats(self.profiler, stream=out).sort_stats(sort).print_stats(n)
+        return out.getvalue()
+
+
+    def summary(self):
+        phases = {k: {'seconds': v[0], 'count': v[1]} for k, v in self.phases.items()}
+        return {'phases': phases,
+                'decisions': {'count': self.decisions, 'mean_ms': self.latency_sum / self.decisions * 1e3 if self.decisions else None,
+                              'edges_ms': [e * 1e3 for e in self.latency_edges], 'counts': list(self.latency_counts)},
+                'io_bytes': dict(self.io)}
+
+
+    def to_df(self):
+        # phase table, slowest first
+        import pandas as pd
+        df = pd.DataFrame([{'phase': k, 'seconds': v[0], 'count': v[1]} for k, v in self.phases.items()])
+        if len(df):
+            df['share'] = df['seconds'] / df['seconds'].sum()
+            df = df.sort_values('seconds', ascending=False).reset_index(drop=True)
+        return df
+
+
+
+class NullInstrument:
+    """
+    Instrument that records nothing, so an uninstrumented run pays one no-op call per phase.
+    """
+
+    enabled = False
+    profile = False
+
+    def now(self):
+        return 0.0
+
+
+    def begin(self):
+        pass
+
+
+    def lap(self, name):
+        pass
+
+
+    def decision(self, t0):
+        pass
+
+
+    def add_io(self, target, nbytes):
+        pass
+
+
+    def phase(self, name):
+        return contextlib.nullcontext(self)
+
+
+    def profiling(self):
+        return contextlib.nullcontext(self)
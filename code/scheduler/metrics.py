@@ -0,0 +1,251 @@
+"""
+Evaluation metrics of runs, computed on the in-memory logs (SchLog, FleetScheduler) with numpy, no csv round trip.
+
+Runs flattens the executed and failed schedules of any number of runs into row arrays tagged with a run id,
+so every metric is one pass of grouped numpy operations whatever the number of runs:
+
+    runs = Runs.from_schlog(sch.sch)                   # one run per policy block of the log
+    summary(runs, mini=400, clipped=[batt.clipped])    # one row per run
+    sensing_gaps(runs)                                 # one row per run and sensor
+
+Metrics:
+    'soc_trajectory': soc before / after every executed schedule
+    'time_below': time the soc spent under a level (Battery.mini), linear between trajectory points
+    'sensing_gaps': achieved gap between two sensings of a sensor against its ideal_interval
+    'failures': schedules that failed for 'soc not enough', delays and schedules never executed
+    'clipped': energy lost to a full battery (Battery.clipped), passed in per run
+"""
+import numpy as np
+import pandas as pd
+from scheduler.schlog import NAT
+
+
+class Runs:
+    """
+    Schedules of many runs as flat arrays, sorted by run then schedule time.
+
+    Variables:
+        1. 'run': run id of each row
+        2. 'schd_time', 'exe_time': epoch seconds, exe_time is NAT if not executed
+        3. 'start_soc', 'end_soc': soc before / after the execution
+        4. 'sensors': (rows, S) mask over 'names'
+        5. 'failed': the schedule hit 'soc not enough' at least once
+        6. 'policy': policy name of each run
+        7. 'ideal_interval', 'has': (runs, S) ideal interval (hours) of the run's sensors / run carries the sensor
+        8. 'failed_steps': control steps with a due schedule that could not run, per run. 'None': not counted (SchLog)
+    """
+
+    def __init__(self, run, schd_time, exe_time, start_soc, end_soc, sensors, failed, policy, names, ideal_interval, has=None, failed_steps=None):
+        order = np.lexsort((schd_time, run))
+        self.run = np.asarray(run, dtype=np.int64)[order]
+        self.schd_time = np.asarray(schd_time, dtype=np.int64)[order]
+        self.exe_time = np.asarray(exe_time, dtype=np.int64)[order]
+        self.start_soc = np.asarray(start_soc, dtype=float)[order]
+        self.end_soc = np.asarray(end_soc, dtype=float)[order]
+        self.sensors = np.asarray(sensors, dtype=bool).reshape(len(order), len(names))[order]
+        self.failed = np.asarray(failed, dtype=bool)[order]
+        self.policy = list(policy)
+        self.names = list(names)
+        self.ideal_interval = np.broadcast_to(np.asarray(ideal_interval, dtype=float), (len(self.policy), len(self.names)))
+        self.has = np.ones(self.ideal_interval.shape, dtype=bool) if has is None else np.asarray(has, dtype=bool)
+        self.failed_steps = None if failed_steps is None else np.asarray(failed_steps, dtype=np.int64)
+
+
+    @property
+    def exed(self):
+        return self.exe_time != NAT
+
+
+    def __len__(self):
+        # number of runs
+        return len(self.policy)
+
+
+    @classmethod
+    def from_schlog(cls, log):
+        """
+        Rows of a SchLog held in memory. A new run starts where the policy changes or the schedule time goes back,
+        e.g. the ES-Adap and DynaES runs of one shared log.
+        """
+        d = log.rows()
+        new = np.ones(len(d), dtype=bool)
+        new[1:] = (d['policy'][1:] != d['policy'][:-1]) | (d['schd_time'][1:] < d['schd_time'][:-1])
+        run = np.cumsum(new) - 1
+        bit = 1 << log.infos.index('soc not enough') if 'soc not enough' in log.infos else 0
+        ideal = [log.profile.get(s, {}).get('ideal_interval', np.nan) for s in log.sensors]
+        return cls(run, d['schd_time'], d['exe_time'], d['start_soc'], d['end_soc'], d['sensors'], (d['info'] & bit) != 0,
+                   [log.policies[p] for p in d['policy'][new]], log.sensors, ideal)
+
+
+    @classmethod
+    def from_fleet(cls, fleet):
+        # executed schedules of a FleetScheduler, one run per node
+        log = {c: np.concatenate(v) if v else np.zeros((0, len(fleet.sensors.names)) if 'sensors' == c else 0) for c, v in fleet.log.items()}
+        return cls(log['node'], log['schd_time'], log['exe_time'], log['start_soc'], log['end_soc'], log['sensors'],
+                   np.zeros(len(log['node']), dtype=bool), [fleet.plc.name] * fleet.n, fleet.sensors.names,
+                   fleet.sensors.ideal_interval, fleet.sensors.has, fleet.failed)
+
+
+    @classmethod
+    def concat(cls, runs):
+        """
+        One Runs of many, e.g. the logs of a sweep. Run ids are renumbered in order, sensors are aligned by name.
+        """
+        names = []
+        for r in runs:
+            names += [s for s in r.names if s not in names]
+        cols = {k: [] for k in ['run','schd_time','exe_time','start_soc','end_soc','sensors','failed','ideal','has','steps']}
+        policy, offset = [], 0
+        for r in runs:
+            j = [names.index(s) for s in r.names]
+            sensors = np.zeros((len(r.run), len(names)), dtype=bool)
+            sensors[:, j] = r.sensors
+            ideal, has = np.full((len(r), len(names)), np.nan), np.zeros((len(r), len(names)), dtype=bool)
+            ideal[:, j], has[:, j] = r.ideal_interval, r.has
+            for k, v in [('run', r.run + offset), ('schd_time', r.schd_time), ('exe_time', r.exe_time), ('start_soc', r.start_soc),
+                         ('end_soc', r.end_soc), ('sensors', sensors), ('failed', r.failed), ('ideal', ideal), ('has', has),
+                         ('steps', np.full(len(r), -1) if r.failed_steps is None else r.failed_steps)]:
+                cols[k].append(v)
+            policy += r.policy
+            offset += len(r)
+        cat = {k: np.concatenate(v) if v else np.zeros(0) for k, v in cols.items()}
+        steps = cat['steps'] if len(cat['steps']) and (cat['steps'] >= 0).any() else None
+        return cls(cat['run'], cat['schd_time'], cat['exe_time'], cat['start_soc'], cat['end_soc'],
+                   cat['sensors'].reshape(-1, len(names)), cat['failed'], policy, names,
+                   cat['ideal'].reshape(-1, len(names)), cat['has'].reshape(-1, len(names)), steps)
+
+
+
+def soc_trajectory(runs):
+    """
+    Soc of each run before (exe_time - 1s) and after (exe_time) every executed schedule: arrays run, time, soc.
+    """
+    e = runs.exed
+    run = np.repeat(runs.run[e], 2)
+    time = np.column_stack([runs.exe_time[e] - 1, runs.exe_time[e]]).ravel()
+    soc = np.column_stack([runs.start_soc[e], runs.end_soc[e]]).ravel()
+    return run, time, soc
+
+
+def time_below(runs, level):
+    """
+    Seconds each run spent with soc under 'level', soc linear between trajectory points.
+    'level': scalar or one value per run.
+    """
+    run, time, soc = soc_trajectory(runs)
+    level = np.broadcast_to(np.asarray(level, dtype=float), (len(runs),))
+    if len(run) < 2:
+        return np.zeros(len(runs))
+    same = run[1:] == run[:-1]                     # segments inside a run
+    r, dt = run[1:][same], (time[1:] - time[:-1])[same]
+    s0, s1 = soc[:-1][same], soc[1:][same]
+    lo, hi, lv = np.minimum(s0, s1), np.maximum(s0, s1), level[r]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        frac = np.where(hi <= lv, 1.0, np.where(lo >= lv, 0.0, (lv - lo) / (hi - lo)))
+    return np.bincount(r, weights=frac * dt, minlength=len(runs))
+
+
+def time_below_steps(socs, step, level):
+    # exact seconds under 'level' from a soc recorded every step, e.g. FleetScheduler(record_soc=True): (steps, runs)
+    return (np.asarray(socs) < level).sum(axis=0) * step
+
+
+def sensing_gaps(runs):
+    """
+    Achieved gaps between consecutive sensings of every sensor of every run, against its ideal_interval.
+    One row per run and sensor: sensings, gaps, mean / max gap (hours), 'ratio' mean gap / ideal_interval,
+    'late' share of gaps longer than ideal_interval.
+    """
+    R, S = len(runs), len(runs.names)
+    row, j = np.nonzero(runs.sensors & runs.exed[:, None])
+    g, t = runs.run[row], runs.exe_time[row]
+    order = np.lexsort((t, j, g))
+    key, t = (g * S + j)[order], t[order]
+    same = key[1:] == key[:-1]
+    gk, gap = key[1:][same], (t[1:] - t[:-1])[same] / 3600
+    ideal = runs.ideal_interval.ravel()
+
+    count = np.bincount(gk, minlength=R*S)
+    total = np.bincount(gk, weights=gap, minlength=R*S)
+    longest = np.zeros(R*S)
+    np.maximum.at(longest, gk, gap)
+    late = np.bincount(gk, weights=gap > ideal[gk], minlength=R*S)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.where(count > 0, total / count, np.nan)
+        df = pd.DataFrame({'run': np.repeat(np.arange(R), S), 'policy': np.repeat(runs.policy, S) if R else [],
+                           'sensor': np.tile(runs.names, R), 'ideal_h': ideal,
+                           'sensings': np.bincount(key, minlength=R*S), 'gaps': count,
+                           'mean_gap_h': mean, 'max_gap_h': np.where(count > 0, longest, np.nan),
+                           'ratio': mean / ideal, 'late': np.where(count > 0, late / count, np.nan)})
+    return df[runs.has.ravel()].reset_index(drop=True)
+
+
+def failures(runs):
+    """
+    Per run: schedules, executed, 'failed' schedules that hit 'soc not enough', 'unexecuted' schedules
+    (the pending last one of a run not counted), mean / max delay between schedule and execution (hours).
+    """
+    R = len(runs)
+    e = runs.exed
+    last = np.ones(len(runs.run), dtype=bool)
+    last[:-1] = runs.run[1:] != runs.run[:-1]
+    delay = np.where(e, (runs.exe_time - 1 - runs.schd_time) / 3600, 0.0)
+    longest = np.zeros(R)
+    np.maximum.at(longest, runs.run[e], delay[e])
+    executed = np.bincount(runs.run[e], minlength=R)
+    res = {'schedules': np.bincount(runs.run, minlength=R), 'executed': executed,
+           'failed': np.bincount(runs.run[runs.failed], minlength=R),
+           'unexecuted': np.bincount(runs.run[~e & ~last], minlength=R)}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        res['mean_delay_h'] = np.where(executed > 0, np.bincount(runs.run, weights=delay, minlength=R) / executed, np.nan)
+    res['max_delay_h'] = np.where(executed > 0, longest, np.nan)
+    if runs.failed_steps is not None:
+        res['failed_steps'] = runs.failed_steps
+    return res
+
+
+def summary(runs, mini=None, clipped=None):
+    """
+    One row per run: time span, failures, sensings, soc extremes, time under 'mini' (scalar or per run),
+    sensing gap ratio / late share over all the run's sensors, and 'clipped' energy (per run, e.g. Battery.clipped).
+    """
+    R = len(runs)
+    e = runs.exed
+    first = np.ones(len(runs.run), dtype=bool)
+    first[1:] = runs.run[1:] != runs.run[:-1]
+    last = np.ones(len(runs.run), dtype=bool)
+    last[:-1] = first[1:]
+    res = pd.DataFrame({'run': np.arange(R), 'policy': runs.policy})
+    start, end = np.full(R, NAT), np.full(R, NAT)
+    start[runs.run[first]], end[runs.run[last]] = runs.schd_time[first], runs.schd_time[last]
+    res['start'] = pd.to_datetime(np.where(start == NAT, np.nan, start), unit='s')
+    res['end'] = pd.to_datetime(np.where(end == NAT, np.nan, end), unit='s')
+    for k, v in failures(runs).items():
+        res[k] = v
+    res['sensings'] = np.bincount(runs.run, weights=(runs.sensors & e[:, None]).sum(axis=1), minlength=R).astype(np.int64)
+
+    soc_min = np.full(R, np.inf)
+    np.minimum.at(soc_min, runs.run[e], runs.end_soc[e])
+    res['min_soc'] = np.where(np.isinf(soc_min), np.nan, soc_min)
+    final = np.full(R, np.nan)
+    er = runs.run[e]
+    if len(er):
+        final[er] = runs.end_soc[e]                # later rows of a run overwrite earlier ones
+    res['final_soc'] = final
+    if mini is not None:
+        below = time_below(runs, mini)
+        span = (end - start).astype(float)
+        res['below_mini_h'] = below / 3600
+        with np.errstate(divide='ignore', invalid='ignore'):
+            res['below_mini_share'] = np.where(span > 0, below / span, np.nan)
+
+    gaps = sensing_gaps(runs)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        g = gaps[gaps['gaps'] > 0]
+        res['gap_ratio'] = g.groupby('run')['ratio'].mean().reindex(res['run']).values
+        late = np.bincount(g['run'], weights=g['late'] * g['gaps'], minlength=R)
+        n = np.bincount(g['run'], weights=g['gaps'], minlength=R)
+        res['late_share'] = np.where(n > 0, late / n, np.nan)
+    if clipped is not None:
+        res['clipped'] = np.broadcast_to(np.asarray(clipped, dtype=float), (R,))
+    return res
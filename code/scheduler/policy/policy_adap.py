@@ -1,3 +1,5 @@
+import numpy as np
+
 
 class Policy:
   """
@@ -33,4 +35,24 @@ class Policy:
     nx_sch = {'time': interval, 'sensors': list(sensor_profile.keys())}
     
     
-    return nx_sch
\ No newline at end of file
+    return nx_sch
+
+
+  def run_batch(self, battery, timer, sensors, simulator, resolution, idx, panel=1.0):
+    """
+    run() for several nodes at once.
+    battery: FleetBattery, sensors: FleetSensors, idx: nodes to decide for
+    return:
+        { 'time': array, 'sensors': (len(idx), S) mask }
+    """
+    if self.interval:
+      interval = self.interval
+    elif 'hour'==resolution:
+      interval = 1
+    elif 'second'==resolution:
+      interval = 3600
+
+    soc_perc = battery.soc[idx]/battery.capacity[idx]
+    times = interval * np.select([soc_perc >= 0.8, soc_perc >= 0.6, soc_perc >= 0.4, soc_perc >= 0.2], [1, 2, 4, 8], default=1)
+
+    return {'time': times, 'sensors': sensors.has[idx].copy()}
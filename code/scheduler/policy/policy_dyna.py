@@ -1,4 +1,5 @@
-import pandas as pd
+import numpy as np
+from scheduler.sensors import SensorStore
 
 class Policy:
   """
@@ -6,95 +7,135 @@ class Policy:
   return:
       { 'time': int, 'sensors': [] }
       time's unit is the energy_gain's step resolution
+
+  Energy sums come from the simulator's cumulative energy index (Simulator.energy_index), so a decision
+  never materializes or loops over the energy window; run() and run_batch() share one array kernel (decide).
+  'horizon': lookahead in hours, at most the simulator's prediction window (Simulator.window, ValueError otherwise:
+  raise the window for longer horizons). The decision cost does not depend on it.
+
+  Robust mode ('scenarios': simulator.scenarios.EnergyScenarios) plans against sampled energy trajectories instead of
+  the point prediction: the energy to allocate is the 'quantile' of the trajectories' energy at the end of the range,
+  and the schedule is moved to the first step with enough soc in at least 1 - 'quantile' of them.
+  All trajectories are evaluated at once, one row of energy per trace row.
   """
-  
-  def __init__(self, name, energy_scaler_switch=True):
+
+  def __init__(self, name, energy_scaler_switch=True, horizon=72, scenarios=None, quantile=0.1):
     self.name = name
+    self.horizon = horizon
+    self.scenarios = scenarios
+    self.quantile = quantile
     self.scaler_pred_col = 'DC_prediction_scaler'
     self.scaler_true_col = 'dc_actual'
     self.energy_pred_scale = None
     self.energy_true = None
     self.energy_scaler_switch = energy_scaler_switch
 
-    
-  def run(self, timer, battery, sensor_profile, simulator, resolution, sch):
-    energy_gain = simulator.load_energy_pred(resolution=resolution)    # prep pred energy dataframe on simulator
-    batt = battery
-
-    # exe energy and sch
-    if 'hour'==resolution:              # set cal range to
-      energy_gain = energy_gain[:72]    # x hours
-    elif 'second'==resolution:
-      energy_gain = energy_gain[:259200]
-
-    sensors = list(sensor_profile.keys())
-    consums = [sensor_profile[x]['consum'] for x in sensors]
-    ideal_intervals = [sensor_profile[x]['ideal_interval'] for x in sensors]
-    last_used_times = [sensor_profile[x]['last_used_time'] for x in sensors]
-    time_gaps = [sensor_profile[x]['time_gap'] for x in sensors]
-    prioritys = [sensor_profile[x]['priority'] for x in sensors]
-    
-    # accu energy
-    accu_energy = [energy_gain[0]+batt.soc]        # init the accumulated energy: ([0,10,20],1)->[1,11,31]
-    for i in range(1,len(energy_gain)):
-      accu_energy.append(accu_energy[i-1]+energy_gain[i])
-    
+
+  def decide(self, timer, simulator, resolution, soc, mini, base, has, consums, prioritys, panel=1.0):
+    """
+    Decision kernel for one or more nodes.
+    soc, mini, base, panel: (nodes,); has, consums, prioritys: (nodes, sensors)
+    return: time (before abnormal-value prevention), sensors mask, low predicted gain mask
+    """
+    if self.horizon * 3600 > simulator.window:
+      raise ValueError("horizon %sh exceeds the simulator's prediction window %ss" % (self.horizon, simulator.window))
+    horizon = self.horizon * 3600 // simulator.res_step(resolution)    # set cal range to x hours, in steps
+    column = simulator.energy_pred_col
+    idx = simulator.energy_index(column, resolution)
+    g0 = simulator.grid_index(timer.now, resolution)
+    n_steps = min(horizon, simulator.grid_index(timer.now + simulator.window, resolution) - g0)    # within the prediction window
+
+    # accu energy at the end of the range: soc + gain
+    if self.scenarios is None:
+      accu_end = soc + panel * simulator.dc_alpha * (idx(g0+n_steps) - idx(g0))
+    else:             # robust: quantile over the sampled trajectories
+      bounds, cum = self.scenarios.sample(simulator, column, resolution, g0, n_steps)    # shared by the nodes
+      scale = np.broadcast_to(np.asarray(panel, dtype=float) * simulator.dc_alpha, soc.shape)
+      accu_end = soc + scale * np.quantile(cum[:,-1], self.quantile)
+
     # allocate energy
-    energy_gain_sum, priority_sum = accu_energy[-1], sum(prioritys)
-    tot_energy = energy_gain_sum - batt.mini        # gain(soc) - mini
-    if tot_energy <= 0:        # if low predicted energy gain, sleep 3 days
+    tot_energy = accu_end - mini
+    low = tot_energy <= 0                                   # low predicted energy gain
+    with np.errstate(divide='ignore', invalid='ignore'):   # nodes with low gain are masked out at the end
+      energy_priority_ratio = tot_energy / prioritys.sum(axis=1)
+      allocated_energy = prioritys * energy_priority_ratio[:,None]
+      sensing_times = allocated_energy / consums              # operation amount
+      interval_all_sensors = np.where(has, n_steps / sensing_times, np.inf)
+
+      # cal time: select the most frequent sensor and the ones within 1 step of it
+      min_sensing_interval = interval_all_sensors.min(axis=1)
+      nx_sensor = has & (interval_all_sensors - min_sensing_interval[:,None] <= 1)
+      times = np.where(nx_sensor, interval_all_sensors, -np.inf).max(axis=1)
+      req_energy = base + (nx_sensor * consums).sum(axis=1)  # calculate the needed energy for next schedule
+      times = np.where(times == np.floor(times), times, np.floor(times) + 1)     # make the max 'op time' of sensors integer
+      times = np.minimum(times, n_steps)                      # if time is out of energy prediction range
+      times = np.where(low | ~np.isfinite(times), n_steps, times)
+
+      # search for the cloest time point that have enough energy, in case not enough energy during low-energy-gain time
+      if self.scenarios is None:
+        g = simulator.first_above(column, resolution, g0, lo=g0+times.astype(np.int64), hi=g0+n_steps, soc=soc, req=req_energy, scale=panel)
+      else:
+        g = self.scenarios.first_enough(bounds, cum, (req_energy - soc) / scale, lo=times, hi=n_steps, quantile=self.quantile)
+        g = np.where(g >= 0, g0 + g, -1)
+      times = np.where(g >= 0, g - g0, times)
+      times = np.where(accu_end < req_energy, times + np.trunc(n_steps * ((req_energy-accu_end)/accu_end)), times)  # if insufficient energy for the whole time, ask delay(proportional) based on curr weather
+
+    # if batt is low, sleep more hours
+    low_soc = soc < mini-1
+    times = np.where(low_soc, times + np.trunc(((mini-soc)/mini)*8* 2.0), times)  # delay if low soc. 10: levels, 1.0: hour/level, unit: hour
+    if 'second'==resolution:
+      times = np.where(low_soc, times * 60*60, times)
+
+    return times, nx_sensor & ~low[:,None], low
+
+
+  def limit(self, resolution):
+    # longest schedule before it is forced to 24, unit of the resolution. Second mode keeps its historical 72
+    return self.horizon if 'hour'==resolution else 72
+
+
+  def run(self, timer, battery, sensor_profile, simulator, resolution, sch):
+    if isinstance(sensor_profile, dict):
+      sensor_profile = SensorStore.from_dict(sensor_profile)
+    sensors = sensor_profile.names
+    consums = sensor_profile.consum.astype(float)[None]
+    prioritys = sensor_profile.priority.astype(float)[None]
+    has = np.ones(consums.shape, dtype=bool)
+
+    times, nx_sensor, low = self.decide(timer, simulator, resolution, np.array([battery.soc], dtype=float), battery.mini,
+                                        battery.base_consume, has, consums, prioritys)
+    if low[0]:        # if low predicted energy gain, sleep 3 days
       if 'hour'==resolution:
         return {'time': 24*3, 'sensors': [] }
       elif 'second'==resolution:
         return {'time': 24*3*3600, 'sensors': [] }
-    energy_priority_ratio = tot_energy / priority_sum
-    allocated_energy = [x * energy_priority_ratio for x in prioritys]
-    
-    # operation amount
-    sensing_times = [x/y for x,y in zip(allocated_energy,consums)]
-    #sensing_times_w_order = [[x[0],energy_gain_sum/(x[1]*x[2]), []] for x in sorted(list(zip(range(len(sensors)), sensing_times, consums)), key=lambda x: x[1], reverse=True) ]     # tot_engery / times*consum. ?
-    
-    # cal time
-    interval_all_sensors = [len(energy_gain) / x for x in sensing_times]
-    min_sensing_interval = min(interval_all_sensors)
-    nx_sensor = []
-    for i in range(len(interval_all_sensors)):
-      if interval_all_sensors[i] - min_sensing_interval <= 1:
-        nx_sensor.append(i)
-    schded_sensor = [sensors[x] for x in nx_sensor]
-    
-    nx_schd = {'sensors': schded_sensor, 'time': max([interval_all_sensors[x] for x in nx_sensor]) }    # select the most frequent sensor
-    req_energy = batt.base_consume + sum([sensor_profile[x]['consum'] for x in schded_sensor])   # calculate the needed energy for next schedule
-    if not nx_schd['time'].is_integer():      # make the max 'op time' of sensors integer
-      nx_schd['time'] = int(nx_schd['time']) + 1  
-    
-    if nx_schd['time'] < len(accu_energy):    # if time is out of energy prediction range 
-      avai_energy = accu_energy[ nx_schd['time'] ]+batt.soc-batt.mini       # get the total available energy for the energy prediction range
-    else:                                     # if 'op time' is in the range
-      nx_schd['time'] = len(accu_energy)
-        
-    # search for the cloest time point that have enough energy, in case not enough energy during low-energy-gain time
-    for i in range(int(nx_schd['time']),len(accu_energy)): 
-      if accu_energy[i] > req_energy:
-        nx_schd['time'] = i 
-        break
-    if accu_energy[-1] < req_energy:  # if insufficient energy for the whole time
-      nx_schd['time'] += int(len(accu_energy) * ((req_energy-accu_energy[-1])/accu_energy[-1]))  # ask delay(proportional) based on curr weather
-    
-    if batt.soc < batt.mini-1: # if batt is low, sleep more hours
-      #print('low: ', batt.soc, batt.mini, (batt.mini-batt.soc)/batt.mini, ((batt.mini-batt.soc)/batt.mini)*10* 1.0 ) 
-      nx_schd['time'] += int(((batt.mini-batt.soc)/batt.mini)*8* 2.0)  # delay if low soc. 10: levels, 1.0: hour/level, unit: hour
-      #nx_schd['time'] += int( batt.mini/(batt.mini-batt.soc) )*10* 1.0)  # delay if low soc. 10: levels, 1.0: hour/level, unit: hour
-      if 'second'==resolution:
-        nx_schd['time'] *= 60*60 
-    
+
+    nx_schd = {'sensors': [sensors[x] for x in np.flatnonzero(nx_sensor[0])], 'time': int(times[0])}
+
     # prevention for abnormal values
-    if nx_schd['time']<0: 
+    if nx_schd['time']<0:
       print(timer.curr_time, 'Warning: Negative: ', nx_schd['time'], '. Force to 8.')
       nx_schd['time'] = 8
-    elif nx_schd['time'] > 72:
+    elif nx_schd['time'] > self.limit(resolution):
       print(timer.curr_time, 'Warning: Too long: ', nx_schd['time'], '. Force to 24.')
       nx_schd['time'] = 24
-    
+
     return nx_schd
-  
+
+
+  def run_batch(self, timer, battery, sensors, simulator, resolution, idx, panel=1.0):
+    """
+    run() for several nodes at once, same decision per node.
+    battery: FleetBattery, sensors: FleetSensors, idx: nodes to decide for,
+    panel: energy scale of each node on top of the simulator's dc_alpha
+    return:
+        { 'time': array, 'sensors': (len(idx), S) mask }
+    """
+    panel = np.broadcast_to(np.asarray(panel, dtype=float), (len(idx),))
+    times, nx_sensor, low = self.decide(timer, simulator, resolution, battery.soc[idx], battery.mini[idx], battery.base_consume[idx],
+                                        sensors.has[idx], sensors.consum[idx], sensors.priority[idx], panel)
+
+    # prevention for abnormal values
+    times = np.where(times < 0, 8, np.where(times > self.limit(resolution), 24, times))
+    times = np.where(low, 24*3 if 'hour'==resolution else 24*3*3600, times)
+    return {'time': times, 'sensors': nx_sensor}
@@ -0,0 +1,175 @@
+import numpy as np
+from itertools import product
+from collections import OrderedDict
+from scheduler.sensors import SensorStore
+from simulator.Timer import to_epoch
+
+class Policy:
+  """
+  Offline oracle, an upper-bound baseline for the online policies: it knows the true energy gain (energy_true_col)
+  of the whole trace and plans the schedule maximizing priority-weighted sensing by dynamic programming.
+  return:
+      { 'time': int, 'sensors': [] }
+      time's unit is the energy_gain's step resolution
+
+  Model, one step per trace row:
+      state: soc on a grid of 'bins' levels over [0, capacity], and per sensor group the steps since its last sensing,
+          capped at its ideal_interval (hours, in steps: ideal_interval * 3600 / trace step; the trace step must divide an hour)
+      action: sleep, or wake up and sense a subset of the groups for base_consume + the sensors' consum.
+          A wake-up must leave soc >= 'floor' ('None': battery.mini)
+      reward: every sensed sensor earns its priority (time since its last sensing / ideal_interval) capped at 1,
+          so sensing more often than the ideal interval earns nothing more
+      then charge with the true gain (clipped at capacity) and leak, as the Scheduler does.
+  Sensors with the same ideal_interval form a group and are sensed together, so that the cheapest ones do not take
+  all the energy of their cadence. Gap caps are lowered (largest first) to keep at most 'max_states' gap states.
+
+  The value function of a planning window ('horizon' steps, or until 'end') is computed backward once, each step
+  one array operation over all socs, gap states and actions, with soc interpolated between grid levels.
+  run() follows the optimal actions forward from the actual soc to the next wake-up. The window is planned again
+  when half of it has passed, and the rows already passed are dropped from it on the way (a quarter at a time).
+  'second' resolution plans per trace row and returns seconds.
+  Plans are kept per node setting, at most 'max_plans' of them (least recently used dropped first): a fleet with
+  more distinct settings than that plans again at every decision.
+  """
+
+  def __init__(self, name, bins=201, horizon=30*24, end=None, floor=None, max_states=64, max_plans=8):
+    self.name = name
+    self.bins = bins
+    self.horizon = horizon
+    self.end = end                 # epoch second or timestamp, plan until then. 'None': 'horizon' steps ahead
+    self.floor = floor
+    self.max_states = max_states
+    self.max_plans = max_plans
+    self.plans = OrderedDict()     # node setting -> planned window, least recently used first
+
+
+  def groups(self, consum, ideal):
+    # sensor groups: label of each sensor, ideal interval, gap cap, size and consum of each group
+    g_ideal, label = np.unique(np.maximum(np.rint(ideal).astype(np.int64), 1), return_inverse=True)
+    caps = g_ideal.copy()
+    while np.prod(caps) > self.max_states:
+      caps[caps.argmax()] -= 1
+    return label, g_ideal, caps, np.bincount(label, minlength=len(g_ideal)), np.bincount(label, weights=consum, minlength=len(g_ideal))
+
+
+  def tables(self, ideal, caps, count, consum, base):
+    """
+    Per action (subset of groups, action 0: sleep) and gap state: reward, next gap state, energy cost.
+    Gap states are numbered in mixed radix over the groups' caps.
+    """
+    G = len(caps)
+    gaps = np.array(list(product(*[range(1, c+1) for c in caps])), dtype=np.int64).reshape(-1, G)
+    radix = np.array([int(np.prod(caps[i+1:])) for i in range(G)], dtype=np.int64)
+    acts = np.array(list(product([False, True], repeat=G)), dtype=bool).reshape(-1, G)
+    nxt = ((np.where(acts[:,None,:], 1, np.minimum(gaps[None]+1, caps)) - 1) * radix).sum(axis=2)
+    reward = (acts[:,None,:] * count * gaps[None] / ideal).sum(axis=2)
+    cost = np.where(acts.any(axis=1), base + acts @ consum, 0.0)
+    return {'acts': acts, 'radix': radix, 'caps': caps, 'nxt': nxt, 'reward': reward, 'cost': cost}
+
+
+  def solve(self, gains, capacity, floor, leak, tab):
+    # value function V[t] (bins, gap states) of the window, from its end (V = 0) backward
+    B = self.bins
+    x = np.linspace(0, capacity, B)
+    dx = capacity / (B - 1)
+    after = x[None,:] - tab['cost'][:,None]                           # (actions, bins) soc after the wake-up
+    feasible = (after >= floor) | (0 == tab['cost'])[:,None]
+    J = tab['nxt'].shape[1]
+    nxt = tab['nxt'][:,None,:]
+    reward = np.where(feasible[...,None], tab['reward'][:,None,:], -np.inf).astype(np.float32)
+    V = np.zeros((len(gains)+1, B, J), dtype=np.float32)
+    for t in range(len(gains)-1, -1, -1):
+      p = (np.clip(np.minimum(after + gains[t], capacity) - leak, 0, capacity) / dx).astype(np.float32)
+      i0 = np.minimum(p.astype(np.int64), B-2)
+      f = (p - i0)[...,None]
+      ix = i0[...,None] * J + nxt                                     # flat index of (soc level, next gap state)
+      v = V[t+1].ravel()
+      lo = v.take(ix)
+      V[t] = (reward + lo + (v.take(ix + J) - lo) * f).max(axis=0)
+    return V
+
+
+  def plan(self, simulator, row, capacity, floor, leak, base, consum, ideal, scale):
+    # planned window covering trace row 'row', made or made again when needed
+    label, g_ideal, caps, count, g_consum = self.groups(consum, ideal)
+    key = (id(simulator.trace), simulator.energy_true_col, float(scale), float(capacity), float(floor), float(leak), float(base),
+           tuple(label), tuple(g_ideal), tuple(caps), tuple(g_consum))
+    p = self.plans.get(key)
+    last = len(simulator.time) if self.end is None else int(np.searchsorted(simulator.time, to_epoch(self.end), side='right'))
+    if p is None or not (p['t0'] <= row < p['t1']) or (row >= p['mid'] and p['t1'] < last):
+      t1 = max(row + 1, min(last, row + self.horizon))
+      gains = np.asarray(simulator.column(simulator.energy_true_col), dtype=float)[row:t1] * scale
+      tab = self.tables(g_ideal, caps, count, g_consum, base)
+      p = dict(tab, t0=row, t1=t1, mid=(row + t1) // 2, gains=gains, label=label, ideal=g_ideal, V=self.solve(gains, capacity, floor, leak, tab))
+      self.plans[key] = p
+      while len(self.plans) > self.max_plans:
+        self.plans.popitem(last=False)
+    elif 4 * (row - p['t0']) >= p['t1'] - p['t0']:     # drop the rows passed, copied so that their memory is freed
+      p['V'], p['gains'], p['t0'] = p['V'][row - p['t0']:].copy(), p['gains'][row - p['t0']:].copy(), row
+    self.plans.move_to_end(key)
+    return p
+
+
+  def decide(self, simulator, now, soc, capacity, mini, leak_rate, base, consum, ideal, last_used, scale):
+    """
+    Next wake-up of one node after the step at 'now': steps of the trace until it, and the sensed group mask of each sensor.
+    """
+    if simulator.step > 3600 or 3600 % simulator.step:
+      raise ValueError("policy_oracle needs trace steps that divide an hour, the trace step is %ss" % simulator.step)
+    floor = mini if self.floor is None else self.floor
+    leak = leak_rate * simulator.step
+    row = max(int(np.searchsorted(simulator.time, now, side='right')) - 1, 0)
+    ideal = np.asarray(ideal, dtype=float) * (3600 // simulator.step)     # hours -> steps, as the gaps below
+    p = self.plan(simulator, row, capacity, floor, leak, base, consum, ideal, scale)
+
+    # gap state after this step: steps since the last sensing of each group (its latest sensor), capped
+    last_used = np.asarray(last_used, dtype=np.int64)
+    latest = np.full(len(p['caps']), last_used.min())
+    np.maximum.at(latest, p['label'], last_used)
+    since = np.maximum((now - latest) // simulator.step, 0)
+    j = int(((np.minimum(since + 1, p['caps']) - 1) * p['radix']).sum())
+
+    B, dx = self.bins, capacity / (self.bins - 1)
+    x = float(np.clip(min(soc + p['gains'][row - p['t0']], capacity) - leak, 0, capacity))      # sleep through this step
+    for t in range(row + 1, p['t1']):
+      k = t - p['t0']
+      after = x - p['cost']
+      q = np.clip(np.minimum(after + p['gains'][k], capacity) - leak, 0, capacity) / dx
+      i0 = np.minimum(q.astype(np.int64), B-2)
+      nj = p['nxt'][:, j]
+      val = p['V'][k+1][i0, nj] * (1 - (q - i0)) + p['V'][k+1][i0+1, nj] * (q - i0)
+      a = int(np.where((after >= floor) | (0 == p['cost']), p['reward'][:, j] + val, -np.inf).argmax())
+      if a:
+        return t - row, p['acts'][a][p['label']]
+      x = float(np.clip(min(x + p['gains'][k], capacity) - leak, 0, capacity))
+      j = int(p['nxt'][0, j])
+    return max(p['t1'] - row, 1), np.zeros(len(p['label']), dtype=bool)
+
+
+  def run(self, battery, timer, sensor_profile, simulator, resolution, sch):
+    if isinstance(sensor_profile, dict):
+      sensor_profile = SensorStore.from_dict(sensor_profile)
+    steps, mask = self.decide(simulator, timer.now, battery.soc, battery.capacity, battery.mini, battery.leak_rate, battery.base_consume,
+                              sensor_profile.consum.astype(float), sensor_profile.ideal_interval, sensor_profile.last_used, simulator.dc_alpha)
+    return {'time': int(steps * (simulator.step // simulator.res_step(resolution))),
+            'sensors': [s for s, m in zip(sensor_profile.names, mask) if m]}
+
+
+  def run_batch(self, battery, timer, sensors, simulator, resolution, idx, panel=1.0):
+    """
+    run() for several nodes, one node at a time; nodes with the same battery, sensors and panel share one plan.
+    battery: FleetBattery, sensors: FleetSensors, idx: nodes to decide for
+    return:
+        { 'time': array, 'sensors': (len(idx), S) mask }
+    """
+    panel = np.broadcast_to(np.asarray(panel, dtype=float), (len(idx),))
+    times = np.zeros(len(idx), dtype=np.int64)
+    mask = np.zeros((len(idx), len(sensors.names)), dtype=bool)
+    for k, i in enumerate(idx):
+      has = np.flatnonzero(sensors.has[i])
+      steps, m = self.decide(simulator, timer.now, battery.soc[i], battery.capacity[i], battery.mini[i], battery.leak_rate[i],
+                             battery.base_consume[i], sensors.consum[i, has], sensors.ideal_interval[i, has], sensors.last_used[i, has],
+                             simulator.dc_alpha * panel[k])
+      times[k] = steps * (simulator.step // simulator.res_step(resolution))
+      mask[k, has] = m
+    return {'time': times, 'sensors': mask}
@@ -0,0 +1,247 @@
+"""
+Real-time controller for field nodes, on asyncio.
+
+The controller sleeps until the next wake-up time of the on-device runtime (scheduler.runtime) instead of polling,
+reads the scheduled sensors concurrently, each with a timeout, and hands logs and state to a background writer,
+so file I/O never delays a decision.
+
+Energy and soc come from an EnergySource. SimulatedSource stands in for the hardware with a Simulator and a Battery,
+and with AcceleratedClock (virtual time, 'speed' simulated seconds per real second) the whole loop runs in tests:
+
+    ctl = RealtimeController.standin('data/DC_pred.csv', 'data/sensor_profile.json', speed=1e6)
+    asyncio.run(ctl.run(until=ctl.clock.now() + 12*24*3600))
+"""
+import os, json, time, abc, asyncio, inspect, tempfile
+from scheduler import runtime
+
+
+class Clock:
+    """
+    Wall clock, epoch seconds.
+    """
+
+    def now(self):
+        return int(time.time())
+
+
+    async def sleep_until(self, t):
+        await asyncio.sleep(max(0.0, t - time.time()))
+
+
+
+class AcceleratedClock:
+    """
+    Virtual clock starting at 'start' (epoch second): sleeping d simulated seconds takes d/speed real seconds,
+    and time only moves when the controller sleeps, so runs are reproducible.
+    """
+
+    def __init__(self, start, speed=3600.0):
+        self.t = int(start)
+        self.speed = speed
+
+
+    def now(self):
+        return self.t
+
+
+    async def sleep_until(self, t):
+        await asyncio.sleep(max(0.0, (t - self.t) / self.speed))
+        self.t = max(self.t, int(t))
+
+
+
+class EnergySource(abc.ABC):
+    """
+    Battery readings of the node. soc(now): state of charge at epoch second 'now'.
+    drain(amount): energy used by a wake-up and its sensing; on hardware the battery drains by itself.
+    """
+
+    @abc.abstractmethod
+    async def soc(self, now):
+        pass
+
+
+    async def drain(self, amount):
+        pass
+
+
+
+class SimulatedSource(EnergySource):
+    """
+    Stand-in energy source: 'battery' is charged with the simulator's true energy gain and leaks step by step
+    (Battery.project), and is only advanced when read.
+    """
+
+    def __init__(self, simulator, battery, start, resolution='hour'):
+        self.simulator = simulator
+        self.batt = battery
+        self.t = int(start)                 # battery is up to date at this time
+        self.resolution = resolution
+        self.step = runtime.steps[resolution]
+
+
+    async def soc(self, now):
+        n = (int(now) - self.t) // self.step
+        if n > 0:
+            gains = self.simulator.load_energy_steps(self.t, n, resolution=self.resolution)
+            self.batt.settle(gains, self.batt.project(gains, self.step)[-1], self.step)
+            self.t += n * self.step
+        return self.batt.soc
+
+
+    async def drain(self, amount):
+        self.batt.drain(amount)
+
+
+
+class LogWriter:
+    """
+    Background writer of json lines. put() never waits for the disk; lines are written in a worker thread, batched.
+    The latest 'state' is saved with runtime.save_state.
+    """
+
+    def __init__(self, path=None, state_path=None):
+        self.path = path
+        self.state_path = state_path
+        self.queue = None                   # made in start(), on the running loop
+        self.task = None
+        self.written = 0                    # bytes
+
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        self.task = asyncio.ensure_future(self.worker())
+
+
+    def put(self, kind, item):
+        self.queue.put_nowait((kind, item))
+
+
+    def write(self, lines, state):
+        if lines and self.path:
+            with open(self.path, 'a') as f:
+                for line in lines:
+                    self.written += f.write(json.dumps(line) + '\n')
+        if state is not None and self.state_path:
+            runtime.save_state(state, self.state_path)
+
+
+    async def worker(self):
+        loop = asyncio.get_running_loop()
+        done = False
+        while not done:
+            items = [await self.queue.get()]
+            while not self.queue.empty():
+                items.append(self.queue.get_nowait())
+            lines = [x for k, x in items if 'log' == k]
+            states = [x for k, x in items if 'state' == k]
+            done = any('close' == k for k, x in items)
+            await loop.run_in_executor(None, self.write, lines, states[-1] if states else None)
+
+
+    async def close(self):
+        if self.task is not None:
+            self.put('close', None)
+            await self.task
+            self.task = None
+
+
+
+class RealtimeController:
+    """
+    Variables:
+        1. 'runtime': runtime.Runtime, the node's scheduler state and policy
+        2. 'source': EnergySource, soc readings
+        3. 'readers': sensor name -> callable returning a reading, async or not (blocking readers run in a thread)
+        4. 'clock': Clock or AcceleratedClock
+        5. 'timeout': seconds a sensor read may take; a late sensor logs None
+        6. 'log_path', 'state_path': json lines log / state file, written in the background. 'None': not written
+
+    Every wake-up is one runtime.wake() with the measured soc; 'wakes' counts them.
+    """
+
+    def __init__(self, runtime, source, readers=None, clock=None, timeout=5.0, log_path=None, state_path=None):
+        self.runtime = runtime
+        self.source = source
+        self.readers = readers or {}
+        self.clock = clock or Clock()
+        self.timeout = timeout
+        self.writer = LogWriter(log_path, state_path)
+        self.wakes = 0
+        self.late = []                      # (scheduled, woke) of wake-ups after their time
+        self.events = []                    # wake-ups that sensed: time, sensors, readings, soc
+
+
+    @classmethod
+    def standin(cls, trace, sensor_path, soc=None, capacity=2000, mini=400, standby=24*30*3600, base_consume=30,
+                policy='policy_dyna', resolution='hour', dc_alpha=0.1, speed=1e6, readers=None, state_path=None, **kwargs):
+        """
+        Controller on a simulated node: SimulatedSource, AcceleratedClock and instant stand-in sensors.
+        state_path: state file of the node, created here and written during the run. 'None': the state is kept in memory only
+        """
+        from simulator.Battery import Battery
+        node = dict(soc=soc, capacity=capacity, mini=mini, standby=standby, base_consume=base_consume, policy=policy,
+                    resolution=resolution, dc_alpha=dc_alpha)
+        if state_path is None:
+            with tempfile.TemporaryDirectory() as tmp:       # init_state writes a file, not kept
+                state = runtime.init_state(os.path.join(tmp, 'state.json'), trace, sensor_path, **node)
+        else:
+            state = runtime.init_state(state_path, trace, sensor_path, **node)
+        rt = runtime.Runtime(state)
+        batt = Battery(soc=state['battery']['soc'], capacity=capacity, mini=mini, standby=standby, base_consume=base_consume)
+        source = SimulatedSource(rt.simulator, batt, state['time'], resolution)
+        readers = readers or {s: (lambda s=s: s) for s in rt.sensors.names}
+        return cls(rt, source, readers, AcceleratedClock(state['time'], speed), state_path=state_path, **kwargs)
+
+
+    async def read(self, name):
+        reader = self.readers.get(name)
+        if reader is None:
+            return None
+        try:
+            if inspect.iscoroutinefunction(reader):
+                return await asyncio.wait_for(reader(), self.timeout)
+            return await asyncio.wait_for(asyncio.get_running_loop().run_in_executor(None, reader), self.timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+    async def read_sensors(self, names):
+        # all sensors at once
+        values = await asyncio.gather(*[self.read(s) for s in names])
+        return dict(zip(names, values))
+
+
+    async def wake(self):
+        # one wake-up: soc, control step, sensing. Returns the next wake-up time
+        now = self.clock.now()
+        self.wakes += 1
+        soc = await self.source.soc(now)
+        res = self.runtime.wake(now, soc=soc)
+        if soc - res['soc'] > 0:
+            await self.source.drain(soc - res['soc'])
+        if res['sense']:
+            readings = await self.read_sensors(res['sense'])
+            event = {'time': now, 'sensors': res['sense'], 'readings': readings, 'soc': res['soc'], 'next_wake': res['next_wake']}
+            self.events.append(event)
+            self.writer.put('log', event)
+        self.writer.put('state', self.runtime.to_state())
+        return res['next_wake']
+
+
+    async def run(self, until=None, max_wakes=None):
+        """
+        Wake up on schedule until epoch second 'until' or 'max_wakes' wake-ups.
+        """
+        self.writer.start()
+        try:
+            while True:
+                next_wake = await self.wake()
+                if (max_wakes is not None and self.wakes >= max_wakes) or (until is not None and next_wake > until):
+                    break
+                await self.clock.sleep_until(next_wake)
+                if self.clock.now() > next_wake:
+                    self.late.append((next_wake, self.clock.now()))
+        finally:
+            await self.writer.close()
+        return self.events
@@ -0,0 +1,196 @@
+"""
+On-device scheduling runtime: one wake-up of a node, without pandas.
+
+Each boot reads a compact state file, runs one control step of the Scheduler (execute the due schedule,
+update sensor priorities, decide the next schedule with the same policy kernel), writes the state back and
+returns the sensors to read now and the next wake-up time. Only the stdlib and numpy are imported, and the
+energy prediction is read from the trace's binary cache (Trace.cached) memory-mapped.
+
+    python -m scheduler.runtime --init --state state.json --trace data/DC_pred.csv --sensor data/sensor_profile.json
+    python -m scheduler.runtime --state state.json --soc 1500          # one wake-up, soc measured by the node
+    python -m scheduler.runtime --state state.json --cold-start 5      # cold-start time of a fresh process
+
+State file:
+    'time': last wake-up, epoch second
+    'policy': policy module in scheduler.policy, 'policy_name': its name
+    'resolution', 'dc_alpha', 'energy_pred_col', 'energy_true_col': see Simulator / Scheduler
+    'trace': binary trace directory
+    'battery': soc, capacity, mini, standby, base_consume
+    'sensors': names, consum, ideal_interval, last_used (epoch second)
+    'next': pending schedule {'time': epoch second, 'sensors': []}, 'None' before the first wake-up
+"""
+import os, sys, json, time
+
+
+steps = {'hour': 3600, 'second': 1}
+policies = {'policy_dyna': 'DynaES', 'policy_adap': 'ES-Adap'}
+
+
+def load_state(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def save_state(state, path):
+    # write a temp file and swap it in, so a power cut never leaves half a state
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f, separators=(',', ':'))
+    os.replace(tmp, path)
+
+
+def init_state(path, trace, sensor_path, soc=None, capacity=2000, mini=400, standby=24*30*3600, base_consume=30,
+               policy='policy_dyna', resolution='hour', dc_alpha=0.1, energy_pred_col='dc_pred_rf', energy_true_col='dc_actual', now=None):
+    """
+    New state file from a sensor profile json. 'trace': energy csv (converted to its binary cache) or cache directory.
+    """
+    from simulator.trace import Trace
+    from scheduler.sensors import SensorStore
+    trace_dir = trace if os.path.isdir(trace) else Trace.build_cache(trace)
+    sensors = SensorStore.load(sensor_path)
+    if now is None:
+        now = int(Trace.load(trace_dir).time[0])
+    state = {'version': 1, 'time': int(now), 'policy': policy, 'policy_name': policies[policy], 'resolution': resolution,
+             'dc_alpha': dc_alpha, 'energy_pred_col': energy_pred_col, 'energy_true_col': energy_true_col,
+             'trace': os.path.abspath(trace_dir),
+             'battery': {'soc': capacity if soc is None else soc, 'capacity': capacity, 'mini': mini, 'standby': standby, 'base_consume': base_consume},
+             'sensors': {'names': sensors.names, 'consum': sensors.consum.tolist(), 'ideal_interval': sensors.ideal_interval.tolist(),
+                         'last_used': sensors.last_used.tolist()},
+             'next': None}
+    save_state(state, path)
+    return state
+
+
+class Runtime:
+    """
+    One node's scheduler state, restored from the state file. wake() is Scheduler.control at time 'now'.
+    """
+
+    def __init__(self, state):
+        import importlib
+        from simulator.Timer import Timer
+        from simulator.Battery import Battery
+        from simulator.EnergySim import Simulator
+        from simulator.trace import Trace
+        from scheduler.sensors import SensorStore
+
+        self.state = state
+        self.resolution = state['resolution']
+        self.step = steps[self.resolution]
+        self.timer = Timer(init_time=int(state['time']))
+        b = state['battery']
+        self.batt = Battery(soc=b['soc'], capacity=b['capacity'], mini=b['mini'], standby=b['standby'], base_consume=b['base_consume'])
+        s = state['sensors']
+        self.sensors = SensorStore(s['names'], s['consum'], s['ideal_interval'], s['last_used'])
+        self.trace = Trace.load(state['trace'], mmap=True)
+        self.simulator = Simulator(self.timer, None, state['dc_alpha'], state['energy_true_col'], state['energy_pred_col'], trace=self.trace)
+        self.plc = importlib.import_module('scheduler.policy.' + state['policy']).Policy(state['policy_name'])
+        self.next = state['next']
+
+
+    def decide(self):
+        # next schedule from now: same call as Scheduler.sch_gen
+        nx_sch = self.plc.run(sensor_profile=self.sensors, timer=self.timer, simulator=self.simulator, battery=self.batt,
+                              resolution=self.resolution, sch=None)
+        return {'time': self.timer.now + int(nx_sch['time']) * self.step, 'sensors': list(nx_sch['sensors'])}
+
+
+    def wake(self, now=None, soc=None):
+        """
+        One control step at 'now' (epoch second, default: the pending schedule time) with the measured 'soc'.
+        Returns the sensors to read now, the next wake-up time and the soc after the sensing.
+        """
+        if now is None:
+            now = self.next['time'] if self.next else int(self.state['time'])
+        now = int(now)
+        self.timer.now = now
+        if soc is not None:
+            self.batt.soc = soc
+
+        # 1. first wake-up: schedule now
+        if self.next is None:
+            self.sensors.update_prior(now)
+            self.next = self.decide()
+            self.next['time'] = now
+
+        # 2. exe sch
+        sense = []
+        if self.next['time'] <= now:
+            tot_drain = self.sensors.total_consum(self.next['sensors']) + self.batt.base_consume
+            if (self.batt.soc - tot_drain) > 0:      # if soc is enough
+                self.batt.drain(tot_drain)
+                self.sensors.reset_prior(now, self.next['sensors'])
+                sense = self.next['sensors']
+
+        # 3. update prior, 4. sch next
+        self.sensors.update_prior(now)
+        if sense:
+            self.next = self.decide()
+            wake_at = self.next['time']
+        else:                                        # not due, or soc not enough: retry at the next step
+            wake_at = max(self.next['time'], now + self.step)
+        return {'time': now, 'sense': sense, 'soc': float(self.batt.soc), 'next_wake': wake_at, 'next': self.next}
+
+
+    def to_state(self):
+        state = dict(self.state)
+        state['time'] = self.timer.now
+        state['battery'] = dict(state['battery'], soc=float(self.batt.soc))
+        state['sensors'] = dict(state['sensors'], last_used=self.sensors.last_used.tolist())
+        state['next'] = self.next
+        return state
+
+
+
+def wake(path, now=None, soc=None, dry_run=False):
+    # one boot: load state, control step, save state
+    rt = Runtime(load_state(path))
+    res = rt.wake(now=now, soc=soc)
+    if not dry_run:
+        save_state(rt.to_state(), path)
+    return res
+
+
+def cold_start(path, repeat=5):
+    """
+    Wall time of a fresh interpreter doing one dry-run wake-up, seconds: best of 'repeat'.
+    'process': whole process, 'import': runtime imports, 'wake': state load + decision
+    """
+    import subprocess
+    code = ("import time; t0=time.perf_counter(); import scheduler.runtime as r; from scheduler.policy import {p}; t1=time.perf_counter(); "
+            "r.wake({path!r}, dry_run=True); t2=time.perf_counter(); import sys; print(t1-t0, t2-t1, 'pandas' in sys.modules)")
+    code = code.format(p=load_state(path)['policy'], path=os.path.abspath(path))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([os.path.dirname(os.path.dirname(os.path.abspath(__file__))), os.environ.get('PYTHONPATH', '')]))
+    res = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True, env=env).stdout.split()
+        res.append({'process': time.perf_counter() - t, 'import': float(out[0]), 'wake': float(out[1]), 'pandas': out[2] == 'True'})
+    return min(res, key=lambda r: r['process'])
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='One wake-up of the on-device scheduler')
+    parser.add_argument('--state', required=True, help='state file')
+    parser.add_argument('--init', action='store_true', help='create the state file')
+    parser.add_argument('--trace', default='data/DC_pred.csv', help='with --init: energy csv or binary trace directory')
+    parser.add_argument('--sensor', default='data/sensor_profile.json', help='with --init: sensor profile')
+    parser.add_argument('--policy', default='policy_dyna', choices=list(policies), help='with --init: policy')
+    parser.add_argument('--resolution', default='hour', choices=list(steps), help='with --init: resolution')
+    parser.add_argument('--now', type=int, default=None, help='wake-up time, epoch second. Default: the pending schedule time')
+    parser.add_argument('--soc', type=float, default=None, help='measured soc')
+    parser.add_argument('--dry-run', action='store_true', help='do not write the state back')
+    parser.add_argument('--cold-start', type=int, default=0, help='measure the cold start over n fresh processes')
+    args = parser.parse_args(argv)
+
+    if args.init:
+        init_state(args.state, args.trace, args.sensor, policy=args.policy, resolution=args.resolution, now=args.now)
+    elif args.cold_start:
+        print(json.dumps(cold_start(args.state, args.cold_start)))
+    else:
+        print(json.dumps(wake(args.state, now=args.now, soc=args.soc, dry_run=args.dry_run)))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,408 @@
+import os, ast, json
+import numpy as np
+import pandas as pd
+from scheduler.sensors import SensorStore
+
+
+NAT = np.iinfo(np.int64).min        # missing time
+
+
+class SchLog:
+    """
+    Append-only, in-memory schedule log.
+    Rows are kept in a preallocated numpy record array and only become a dataframe when asked (to_df).
+    Only the last row (tail) is mutable, so rows before it are final and can be written to disk in batches.
+
+    Columns are typed: times are epoch seconds, 'sensors' is a mask over the sensor names, and the sensor profile
+    snapshot of the 'priority' column is kept as numeric per-sensor columns (last_used_time, time_gap, priority).
+    The legacy dict/list values are rebuilt only for to_df / csv export.
+    The csv has the legacy columns and reads back with load_csv, but it is not byte-identical to the per-row csv
+    written before this log: socs are floats ('2000.0' where a run started from an int soc logged '2000'), and the
+    pending last row keeps its priority snapshot (left empty before).
+
+    Variables:
+        1. columns: log columns, see Scheduler.sch_columns
+        2. sensors: SensorStore, sensor profile dict (or sensor names); 'consum' and 'ideal_interval' are kept to rebuild the priority dict
+        3. path: file the log is flushed to. 'None': in-memory only
+            '*.csv': legacy csv, the whole file is loaded and rewritten when a row on disk changes
+            otherwise: binary record file (+ '.json' meta), rows are fixed size and written in place,
+            and a resumed run reads only the tail row
+        4. flush_every: number of finalized rows to buffer before writing them to disk.
+            'None': flush only when asked, e.g. at the end of a run
+
+    fork() starts a new log from this one: the finalized rows are shared as read-only segments (never written again
+    by either log) and only the tail row is copied, so a fork costs O(1) whatever the log length.
+    """
+
+    def __init__(self, columns, sensors=(), path=None, flush_every=None, capacity=1024):
+        self.columns = list(columns)
+        self.path = path
+        self.flush_every = flush_every
+        self.sensors = list(sensors)
+        self.profile = {s: {k: sensors[s][k] for k in ['consum','ideal_interval'] if k in sensors[s]} for s in self.sensors} if isinstance(sensors, (dict, SensorStore)) else {s: {} for s in self.sensors}
+        self.policies = []        # policy names, 'policy' column stores the index
+        self.infos = []           # info messages, 'info' column stores bit flags
+        self.data = np.zeros(capacity, dtype=self.dtype())
+        self.n = 0
+        self.offset = 0           # rows on disk before the first row in memory
+        self.flushed = 0          # rows in memory already on disk
+        self.dirty = None         # first row on disk modified since
+        self.segments = []        # read-only rows before 'data', shared with the log this one was forked from
+
+
+    def dtype(self):
+        s = len(self.sensors)
+        return np.dtype([('policy','<u2'), ('schd_time','<i8'), ('sensors','?',(s,)), ('start_soc','<f8'), ('end_soc','<f8'),
+                         ('exed','?'), ('exe_time','<i8'), ('last_used_time','<i8',(s,)), ('time_gap','<f8',(s,)),
+                         ('priority','<f8',(s,)), ('info','<u4')])
+
+
+    @property
+    def binary(self):
+        return self.path is not None and not self.path.endswith('.csv')
+
+
+    # ---------- load ----------
+
+    @classmethod
+    def load(cls, path, columns, sensors=(), flush_every=None, tail=True):
+        """
+        Load a schedule log file, rows already on disk are not written again.
+        tail: binary logs only load the last row (enough to resume a run), tail=False loads all rows
+        """
+        if path.endswith('.csv'):
+            return cls.load_csv(path, columns, sensors, flush_every)
+        log = cls(columns, sensors, path=path, flush_every=flush_every)
+        if not os.path.exists(path):
+            return log
+        with open(path + '.json', 'r') as f:
+            meta = json.load(f)
+        log.set_meta(meta)
+        arr = np.memmap(path, dtype=log.dtype(), mode='r') if os.path.getsize(path) else np.zeros(0, dtype=log.dtype())
+        start = max(len(arr) - 1, 0) if tail else 0
+        log.reserve(len(arr) - start)
+        log.data[:len(arr)-start] = arr[start:]
+        log.n = log.flushed = len(arr) - start
+        log.offset = start
+        return log
+
+
+    @classmethod
+    def load_csv(cls, path, columns, sensors=(), flush_every=None):
+        # legacy csv log
+        log = cls(columns, sensors, path=path, flush_every=flush_every)
+        try:
+            df = pd.read_csv(path, parse_dates=['schd_time','exe_time'], dtype={'policy':str,'exed':bool}, float_precision='round_trip')   # socs read back exactly
+            for c in ['sensors','priority','info']:
+                df[c] = df[c].apply(lambda x: ast.literal_eval(x) if isinstance(x,str) else x)
+        except Exception:
+            df = pd.DataFrame([], columns=log.columns)
+            df.to_csv(path, index=False)
+        for row in df.to_dict('records'):
+            log.append(row)
+        log.flushed = log.n
+        return log
+
+
+    def meta(self):
+        return {'version': 1, 'columns': self.columns, 'sensors': self.sensors, 'profile': self.profile,
+                'policies': self.policies, 'infos': self.infos}
+
+
+    def set_meta(self, meta):
+        self.columns, self.sensors, self.profile = meta['columns'], meta['sensors'], meta['profile']
+        self.policies, self.infos = meta['policies'], meta['infos']
+        self.data = np.zeros(len(self.data), dtype=self.dtype())
+
+
+    # ---------- rows ----------
+
+    def __len__(self):
+        return self.n + sum(len(x) for x in self.segments)
+
+
+    @property
+    def empty(self):
+        return 0 == self.n
+
+
+    def reserve(self, n):
+        if n > len(self.data):
+            data = np.zeros(max(n, 2*len(self.data)), dtype=self.data.dtype)
+            data[:self.n] = self.data[:self.n]
+            self.data = data
+
+
+    def add_sensors(self, names):
+        # extend the per-sensor columns with new sensor names
+        new = [s for s in names if s not in self.sensors]
+        if not new:
+            return
+        self.materialize()
+        if self.offset:
+            raise ValueError("sensors %s not in the resumed log %s" % (new, self.path))
+        old, old_sensors = self.data[:self.n], self.sensors
+        self.sensors = old_sensors + new
+        self.profile.update({s: {} for s in new})
+        self.data = np.zeros(max(len(self.data), 1), dtype=self.dtype())
+        for c in old.dtype.names:
+            if old.dtype[c].shape:
+                self.data[c][:self.n, :len(old_sensors)] = old[c]
+            else:
+                self.data[c][:self.n] = old[c]
+        self.data['last_used_time'][:self.n, len(old_sensors):] = NAT
+        self.data['time_gap'][:self.n, len(old_sensors):] = np.nan
+        self.data['priority'][:self.n, len(old_sensors):] = np.nan
+        if self.flushed or self.offset:       # file layout changed
+            self.dirty = 0
+
+
+    def append(self, row):
+        # append a row (dict), the previous tail becomes final
+        self.reserve(self.n + 1)
+        self.n += 1
+        r = self.data[self.n-1]
+        r['schd_time'] = r['exe_time'] = NAT
+        r['start_soc'] = r['end_soc'] = np.nan
+        r['last_used_time'], r['time_gap'], r['priority'] = NAT, np.nan, np.nan
+        for c in self.columns:
+            if c in row:
+                self.set_tail(c, row[c])
+
+
+    def rows(self):
+        # all rows in memory, shared segments first
+        if not self.segments:
+            return self.data[:self.n]
+        return np.concatenate(self.segments + [self.data[:self.n]])
+
+
+    def materialize(self):
+        # copy the shared segments into own rows
+        if not self.segments:
+            return
+        rows = self.rows()
+        self.data = np.zeros(max(len(rows), len(self.data)), dtype=self.data.dtype)
+        self.data[:len(rows)] = rows
+        self.n, self.segments = len(rows), []
+
+
+    def fork(self, path=None, flush_every=None):
+        """
+        New log with the rows of this one. In memory ('path' None) the finalized rows are shared, not copied;
+        with a path of its own the fork holds all rows and writes them to that file.
+        """
+        log = SchLog(self.columns, self.sensors, capacity=16)
+        log.profile = {s: dict(v) for s, v in self.profile.items()}
+        log.policies, log.infos = list(self.policies), list(self.infos)
+        log.segments = list(self.segments)
+        if self.n > 1:
+            frozen = self.data[:self.n-1].view()
+            frozen.flags.writeable = False
+            log.segments.append(frozen)
+        if self.n:
+            log.data[0] = self.data[self.n-1]
+            log.n = 1
+        if path is not None:
+            log.materialize()
+            log.path, log.flush_every = path, flush_every
+        return log
+
+
+    def due(self):
+        # enough finalized rows buffered for a batch flush
+        return bool(self.flush_every) and (self.n - 1 - self.flushed) >= self.flush_every
+
+
+    def set_tail(self, column, value):
+        # modify last row
+        idx = self.n - 1
+        if idx < self.flushed and (self.dirty is None or idx < self.dirty):
+            self.dirty = idx
+        r = self.data[idx]
+        if 'policy' == column:
+            if value not in self.policies:
+                self.policies.append(value)
+            r['policy'] = self.policies.index(value)
+        elif column in ['schd_time','exe_time']:
+            if isinstance(value, (int, np.integer)):        # epoch second
+                r[column] = value
+            else:
+                r[column] = NAT if pd.isna(value) else pd.Timestamp(value).value // 10**9
+        elif 'sensors' == column:
+            value = [] if not isinstance(value, (list, tuple)) else value
+            self.add_sensors(value)
+            r = self.data[idx]
+            r['sensors'] = [s in value for s in self.sensors]
+        elif column in ['start_soc','end_soc']:
+            r[column] = np.nan if pd.isna(value) else value
+        elif 'exed' == column:
+            r['exed'] = bool(value)
+        elif 'priority' == column:
+            self.set_priority(r, value)
+        elif 'info' == column:
+            value = value if isinstance(value, (list, tuple)) else []
+            for m in value:
+                if m not in self.infos:
+                    self.infos.append(m)
+            r['info'] = sum(1 << self.infos.index(m) for m in set(value))
+
+
+    def set_priority(self, r, sensors):
+        # sensor profile dict -> numeric per-sensor columns
+        if isinstance(sensors, SensorStore):
+            return self.set_priority_store(sensors)
+        if isinstance(sensors, str):
+            sensors = ast.literal_eval(sensors)
+        if not isinstance(sensors, dict):
+            return
+        self.add_sensors(list(sensors))
+        r = self.data[self.n-1]
+        for j, s in enumerate(self.sensors):
+            if s in sensors:
+                p = sensors[s]
+                if not self.profile.get(s):
+                    self.profile[s] = {k: p[k] for k in ['consum','ideal_interval'] if k in p}
+                last = p.get('last_used_time')
+                r['last_used_time'][j] = NAT if last is None else pd.Timestamp(last).value // 10**9
+                r['time_gap'][j] = p.get('time_gap', np.nan)
+                r['priority'][j] = p.get('priority', np.nan)
+
+
+    def set_priority_store(self, store):
+        # SensorStore arrays -> numeric per-sensor columns, no per-sensor dicts
+        self.add_sensors(store.names)
+        r = self.data[self.n-1]
+        if store.names == self.sensors:
+            j = slice(None)
+        else:
+            j = [self.sensors.index(s) for s in store.names]
+        for s in store.names:
+            if not self.profile.get(s):
+                self.profile[s] = {'consum': store.consum[store.index[s]].item(), 'ideal_interval': store.ideal_interval[store.index[s]].item()}
+        r['last_used_time'][j] = store.last_used
+        r['time_gap'][j] = store.time_gap
+        r['priority'][j] = store.priority
+
+
+    def get(self, column, i=-1, raw=False):
+        # value of one row, legacy types. 'raw': times as epoch seconds (NAT if missing)
+        r = self.data[i % self.n] if i < 0 or not self.segments else self.rows()[i]
+        if 'policy' == column:
+            return self.policies[r['policy']]
+        elif column in ['schd_time','exe_time']:
+            if raw:
+                return int(r[column])
+            return pd.NA if r[column] == NAT else pd.Timestamp(int(r[column]), unit='s')
+        elif 'sensors' == column:
+            return [s for s, m in zip(self.sensors, r['sensors']) if m]
+        elif column in ['start_soc','end_soc']:
+            return pd.NA if np.isnan(r[column]) else float(r[column])
+        elif 'exed' == column:
+            return bool(r['exed'])
+        elif 'priority' == column:
+            return self.priority_dict(r)
+        elif 'info' == column:
+            return [m for k, m in enumerate(self.infos) if r['info'] >> k & 1]
+
+
+    def tail(self, columns=None, raw=False):
+        # last row as dict
+        return {c: self.get(c, raw=raw) for c in (columns or self.columns)}
+
+
+    def priority_dict(self, r):
+        # numeric per-sensor columns -> sensor profile dict, as logged by the legacy csv
+        if np.isnan(r['priority']).all():
+            return pd.NA
+        res = {}
+        for j, s in enumerate(self.sensors):
+            if np.isnan(r['priority'][j]):
+                continue
+            last = r['last_used_time'][j]
+            res[s] = dict(self.profile.get(s, {}))
+            res[s].update({'last_used_time': None if last == NAT else pd.Timestamp(int(last), unit='s').isoformat(),
+                           'time_gap': float(r['time_gap'][j]), 'priority': float(r['priority'][j])})
+        return res
+
+
+    # ---------- export ----------
+
+    def to_df(self, start=0, end=None, wide=False):
+        """
+        Rows [start, end) as a dataframe with the legacy columns.
+        wide: per-sensor numeric columns ('priority_<s>', 'time_gap_<s>', 'last_used_time_<s>') instead of the priority dict
+        """
+        d = self.rows()[start:end]
+        df = pd.DataFrame({
+            'policy': np.array(self.policies + [None], dtype=object)[d['policy']] if len(d) else [],
+            'schd_time': pd.to_datetime(np.where(d['schd_time'] == NAT, np.datetime64('NaT'), d['schd_time'].astype('datetime64[s]'))),
+            'sensors': [[s for s, m in zip(self.sensors, x) if m] for x in d['sensors']],
+            'start_soc': d['start_soc'],
+            'end_soc': d['end_soc'],
+            'exed': d['exed'],
+            'exe_time': pd.to_datetime(np.where(d['exe_time'] == NAT, np.datetime64('NaT'), d['exe_time'].astype('datetime64[s]'))),
+            'priority': [self.priority_dict(r) for r in d] if not wide else None,
+            'info': [[m for k, m in enumerate(self.infos) if x >> k & 1] for x in d['info']],
+        }, columns=self.columns)
+        if wide:
+            df = df.drop(columns='priority')
+            for j, s in enumerate(self.sensors):
+                df['priority_'+s] = d['priority'][:, j]
+                df['time_gap_'+s] = d['time_gap'][:, j]
+                df['last_used_time_'+s] = pd.to_datetime(np.where(d['last_used_time'][:, j] == NAT, np.datetime64('NaT'), d['last_used_time'][:, j].astype('datetime64[s]')))
+        return df
+
+
+    def export_csv(self, path):
+        # legacy csv, readable by the old load_sch
+        self.to_df().to_csv(path, index=False)
+
+
+    # ---------- flush ----------
+
+    def flush(self, final=True):
+        """
+        Write buffered rows to disk, returns the number of bytes written.
+        final=False keeps the mutable tail in memory, final=True writes it as well.
+        """
+        if self.path is None:
+            return 0
+        end = self.n if final else max(self.n - 1, self.flushed)
+        start = self.flushed if self.dirty is None else self.dirty
+        if self.binary:
+            written = self.flush_binary(start, end)
+        else:
+            written = self.flush_csv(start, end)
+        self.flushed, self.dirty = end, None
+        return written
+
+
+    def flush_csv(self, start, end):
+        if self.dirty is not None or 0 == self.flushed:      # (re)write whole file with header
+            start, mode, header = 0, 'w', True
+        else:                                                # append new rows only
+            mode, header = 'a', False
+        if end <= start and not header:
+            return 0
+        text = self.to_df(start, end).to_csv(index=False, header=header)
+        with open(self.path, mode) as f:
+            f.write(text)
+        return len(text)
+
+
+    def flush_binary(self, start, end):
+        if end <= start and os.path.exists(self.path + '.json'):
+            return 0
+        meta = json.dumps(self.meta())
+        with open(self.path + '.json', 'w') as f:
+            f.write(meta)
+        if self.dirty == 0 and self.offset == 0 and start == 0:     # layout may have changed, rewrite
+            mode = 'wb'
+        else:
+            mode = 'r+b' if os.path.exists(self.path) else 'wb'
+        buf = self.data[start:max(end, start)].tobytes()
+        with open(self.path, mode) as f:
+            f.seek((self.offset + start) * self.data.dtype.itemsize)
+            f.write(buf)
+        return len(buf) + len(meta)
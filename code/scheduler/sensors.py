@@ -0,0 +1,125 @@
+import json
+import numpy as np
+from datetime import datetime, timezone
+
+
+def iso_to_epoch(s):
+    # ISO time string (naive = UTC) -> epoch second
+    dt = datetime.fromisoformat(s)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+def epoch_to_iso(sec):
+    # epoch second -> ISO time string, same as pd.Timestamp.isoformat()
+    return datetime.fromtimestamp(int(sec), tz=timezone.utc).replace(tzinfo=None).isoformat()
+
+
+class SensorStore:
+    """
+    Sensor profile as arrays, one entry per sensor.
+    Variables:
+        'names': sensor names
+        'consum', 'ideal_interval': sensor profile
+        'last_used': last used time, epoch second
+        'time_gap', 'priority': see update_prior
+
+    Loads from and saves to the sensor profile json, and reads like the profile dict (keys(), store[name]['consum']).
+    Priority updates are vectorized over all sensors and nothing is written to disk until save().
+    """
+
+    fields = ['consum', 'ideal_interval', 'last_used_time', 'time_gap', 'priority']
+
+    def __init__(self, names, consum, ideal_interval, last_used, time_gap=None, priority=None, extra=None):
+        self.names = list(names)
+        self.index = {s: i for i, s in enumerate(self.names)}
+        self.consum = np.asarray(consum)
+        self.ideal_interval = np.asarray(ideal_interval)
+        self.last_used = np.asarray(last_used, dtype=np.int64)
+        self.time_gap = np.ones(len(self.names)) if time_gap is None else np.asarray(time_gap, dtype=float)
+        self.priority = np.ones(len(self.names)) if priority is None else np.asarray(priority, dtype=float)
+        self.extra = extra or {s: {} for s in self.names}      # other keys of the profile, kept for save()
+
+
+    @classmethod
+    def from_dict(cls, profile):
+        names = list(profile)
+        get = lambda k, d=None: [profile[s].get(k, d) for s in names]
+        last = [iso_to_epoch(x) if isinstance(x, str) else int(x) for x in get('last_used_time', 0)]
+        extra = {s: {k: v for k, v in profile[s].items() if k not in cls.fields} for s in names}
+        return cls(names, get('consum'), get('ideal_interval'), last, get('time_gap', 1), get('priority', 1), extra)
+
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as f:
+            return cls.from_dict(json.load(f))
+
+
+    def to_dict(self):
+        consum, ideal = self.consum.tolist(), self.ideal_interval.tolist()
+        res = {}
+        for i, s in enumerate(self.names):
+            res[s] = {'consum': consum[i], 'ideal_interval': ideal[i], 'last_used_time': epoch_to_iso(self.last_used[i]),
+                      'time_gap': float(self.time_gap[i]), 'priority': float(self.priority[i])}
+            res[s].update(self.extra.get(s, {}))
+        return res
+
+
+    def save(self, path):
+        # returns bytes written
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f)
+            return f.tell()
+
+
+    def copy(self):
+        return SensorStore(self.names, self.consum.copy(), self.ideal_interval.copy(), self.last_used.copy(),
+                           self.time_gap.copy(), self.priority.copy(), {s: dict(v) for s, v in self.extra.items()})
+
+
+    # profile dict interface
+    def keys(self):
+        return list(self.names)
+
+
+    def __iter__(self):
+        return iter(self.names)
+
+
+    def __len__(self):
+        return len(self.names)
+
+
+    def __contains__(self, name):
+        return name in self.index
+
+
+    def __getitem__(self, name):
+        return self.to_dict()[name] if name in self.index else {}[name]
+
+
+    def mask(self, names):
+        # sensor names -> bool mask
+        m = np.zeros(len(self.names), dtype=bool)
+        m[[self.index[s] for s in names]] = True
+        return m
+
+
+    def total_consum(self, names):
+        return sum(self.consum[self.index[s]] for s in names)
+
+
+    def update_prior(self, curr):
+        # curr: epoch second
+        self.time_gap = 1 + (curr - self.last_used) / 3600
+        self.priority = np.abs(self.time_gap / self.ideal_interval)    # priority formula
+
+
+    def reset_prior(self, curr, names):
+        # reset used sensors prio to 1
+        m = self.mask(names)
+        self.last_used[m] = curr
+        self.time_gap[m] = 1
+        self.priority[m] = 1
@@ -0,0 +1,55 @@
+import copy
+from scheduler.instrument import NullInstrument
+
+
+class Snapshot:
+    """
+    State of a Scheduler at one time: timer, battery, sensor profile, schedule log and policy.
+    Taking one reads no energy data and copies no log rows: the log is forked (SchLog.fork) and shares its
+    finalized rows, the rest is a few scalars and per-sensor arrays.
+
+    fork() starts an independent branch from the snapshot, any number of times, optionally with another policy,
+    panel size (dc_alpha), duration or files. Branches run in memory unless given files of their own.
+    """
+
+    fields = ['sch_columns', 'duration', 'resolution', 'event_driven', 'steps', 'step', 'end', 'next_sch']
+
+    def __init__(self, scheduler):
+        self.cls = type(scheduler)
+        self.state = {k: copy.copy(getattr(scheduler, k)) for k in self.fields}
+        self.timer = copy.copy(scheduler.timer)
+        self.simulator = scheduler.simulator
+        self.batt = copy.deepcopy(scheduler.batt)
+        self.sensors = scheduler.sensors.copy()
+        self.sch = scheduler.sch.fork()
+        self.plc = copy.deepcopy(scheduler.plc)
+
+
+    @property
+    def time(self):
+        return self.timer.curr_time
+
+
+    def fork(self, policy=None, dc_alpha=None, duration=None, sensor_path=None, sch_path=None, flush_every=None, instrument=None):
+        """
+        New Scheduler continuing from the snapshot.
+            'policy': switch to this policy, 'dc_alpha': new panel size from now on,
+            'duration': run length from the original init time, in resolution units,
+            'sensor_path', 'sch_path': files of the branch. 'None': in memory only
+        """
+        sch = self.cls.__new__(self.cls)
+        sch.__dict__.update({k: copy.copy(v) for k, v in self.state.items()})
+        sch.timer = copy.copy(self.timer)
+        sch.simulator = self.simulator.fork(sch.timer, dc_alpha)
+        sch.batt = copy.deepcopy(self.batt)
+        sch.sensors = self.sensors.copy()
+        sch.sensor_path = sensor_path
+        sch.sch_path = sch_path
+        sch.flush_every = flush_every
+        sch.sch = self.sch.fork(path=sch_path, flush_every=flush_every)
+        sch.plc = copy.deepcopy(self.plc) if policy is None else policy
+        sch.inst = instrument or NullInstrument()
+        if duration is not None:
+            sch.duration = duration
+            sch.end = sch.simul_end(sch.resolution, duration)
+        return sch
@@ -0,0 +1,128 @@
+"""
+Parameter sweep over a grid of configurations, run on a process pool.
+
+The energy trace is parsed once into its binary cache (Trace.cached), which every worker maps read-only.
+If the cache cannot be written next to the csv, it is saved to a temp dir for the sweep.
+Each run gets its own sensor profile copy and an in-memory schedule log, so runs never share files.
+
+    python -m scheduler.sweep --grid grid.json --out sweep.csv
+
+grid.json maps a parameter to a list of values, e.g.
+    {"policy": ["policy_dyna", "policy_adap", "policy_oracle"], "dc_alpha": [0.05, 0.1], "capacity": [1000, 2000]}
+'policy_oracle' is the offline upper bound: it sees the true energy and plans until the end of each run.
+"""
+import os, sys, json, time, shutil, argparse, tempfile, itertools
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from simulator.EnergySim import Simulator
+from simulator.Timer import Timer, from_epoch
+from simulator.Battery import Battery
+from simulator.trace import Trace
+from scheduler.controller import Scheduler
+from scheduler import metrics
+from scheduler.policy.policy_adap import Policy as policy_adap
+from scheduler.policy.policy_dyna import Policy as policy_dyna
+from scheduler.policy.policy_oracle import Policy as policy_oracle
+
+
+policies = {'policy_dyna': (policy_dyna, 'DynaES'), 'policy_adap': (policy_adap, 'ES-Adap'),
+            'policy_oracle': (policy_oracle, 'Oracle')}
+
+defaults = {
+    'policy': 'policy_dyna',
+    'energy_pred_col': 'dc_pred_rf',
+    'energy_true_col': 'dc_actual',
+    'dc_alpha': 0.1,
+    'soc': None,                  # None: start full
+    'capacity': 2000,
+    'mini': 400,
+    'standby': 24*30*3600,
+    'base_consume': 30,
+    'duration': 12*24,
+    'resolution': 'hour',
+}
+
+_trace = None                     # trace of the worker process
+
+
+def expand_grid(grid):
+    # {param: [values]} -> list of configs, missing params take the defaults
+    if isinstance(grid, list):
+        return [dict(defaults, **cfg) for cfg in grid]
+    keys = list(grid)
+    return [dict(defaults, **dict(zip(keys, vals))) for vals in itertools.product(*[grid[k] for k in keys])]
+
+
+def _init_worker(trace_dir):
+    global _trace
+    _trace = Trace.load(trace_dir, mmap=True)
+
+
+def run_config(cfg, sensor_path, trace=None):
+    """
+    Run one configuration on its own state and return a summary dict.
+    """
+    trace = _trace if trace is None else trace
+    plc_cls, plc_name = policies[cfg['policy']]
+    soc = cfg['capacity'] if cfg['soc'] is None else cfg['soc']
+    t = time.time()
+    with tempfile.TemporaryDirectory() as tmp:
+        run_sensor_path = shutil.copy(sensor_path, os.path.join(tmp, 'sensor_profile.json'))
+        batt = Battery(soc=soc, capacity=cfg['capacity'], mini=cfg['mini'], standby=cfg['standby'], base_consume=cfg['base_consume'])
+        timer = Timer(init_time=from_epoch(trace.time[0]))
+        simul = Simulator(timer=timer, energy_pred_path=None, dc_alpha=cfg['dc_alpha'], energy_true_col=cfg['energy_true_col'], energy_pred_col=cfg['energy_pred_col'], trace=trace)
+        plc = plc_cls(plc_name)
+        sch = Scheduler(simulator=simul, resolution=cfg['resolution'], duration=cfg['duration'], policy=plc, sensor_path=run_sensor_path, sch_path=None, battery=batt)
+        if 'policy_oracle' == cfg['policy']:
+            plc.end = sch.end                       # plan until the end of the run
+        sch.start()
+    m = metrics.summary(metrics.Runs.from_schlog(sch.sch), mini=cfg['mini'], clipped=[batt.clipped]).iloc[0]    # in-memory log, no csv
+    res = dict(cfg)
+    res.update({k: m[k] for k in ['min_soc','schedules','executed','failed','unexecuted','sensings','mean_delay_h',
+                                  'below_mini_h','gap_ratio','late_share','clipped']})
+    res.update({
+        'final_soc': batt.soc,
+        'wall_time': time.time() - t,
+    })
+    return res
+
+
+def _run(args):
+    return run_config(*args)
+
+
+def run_sweep(grid, energy_pred_path, sensor_path, processes=None, chunksize=1):
+    """
+    Run all configurations of 'grid' across a process pool, returns one row per configuration.
+    """
+    cfgs = expand_grid(grid)
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            trace_dir = Trace.build_cache(energy_pred_path)      # parse once, workers map it read-only
+        except OSError:                                          # read-only data directory: cache in a temp dir
+            trace_dir = Trace.from_csv(energy_pred_path).save(os.path.join(tmp, 'trace'))
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(trace_dir,)) as pool:
+            rows = list(pool.map(_run, [(cfg, sensor_path) for cfg in cfgs], chunksize=chunksize))
+    df = pd.DataFrame(rows)
+    df.insert(0, 'run', range(len(df)))
+    return df
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a parameter sweep on a process pool')
+    parser.add_argument('--grid', required=True, help='json file: {param: [values]} or a list of configs')
+    parser.add_argument('--energy', default='data/DC_pred.csv', help='energy prediction csv')
+    parser.add_argument('--sensor', default='data/sensor_profile.json', help='initial sensor profile')
+    parser.add_argument('--out', default='sweep.csv', help='result table')
+    parser.add_argument('--processes', type=int, default=None, help='pool size, default: cpu count')
+    args = parser.parse_args(argv)
+
+    with open(args.grid, 'r') as f:
+        grid = json.load(f)
+    df = run_sweep(grid, args.energy, args.sensor, processes=args.processes)
+    df.to_csv(args.out, index=False)
+    print('%d runs -> %s' % (len(df), args.out))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,4 +1,5 @@
-
+import numpy as np
+from simulator.Timer import seconds
 
 
 class Battery:
@@ -9,6 +10,7 @@ class Battery:
     standby       : standby time         # second
     leak_rate     : 1/self.standby     # percent / second
     base_consume  : basic energy consumption for each boot up
+    clipped       : energy lost to a full battery so far
     
     """
     
@@ -19,20 +21,77 @@ class Battery:
         self.standby = standby              # second
         self.leak_rate = self.capacity / self.standby     # second
         self.base_consume = base_consume
+        self.clipped = 0.0
         
     
     def drain(self, drain):
-        soc = self.soc - drain
-        self.soc = [0,soc][soc>0]
+        self.soc = max(0, self.soc - drain)
         
         
     def charge(self, gain):
         soc = self.soc + gain
-        self.soc = [soc,self.capacity][soc>self.capacity]
+        if soc > self.capacity:
+            self.clipped += soc - self.capacity
+        self.soc = min(soc, self.capacity)
         
         
     def leak(self, duration):
-        self.soc -= (self.leak_rate * duration.total_seconds())
+        self.soc -= (self.leak_rate * seconds(duration))
+        
+        
+    def project(self, gains, duration):
+        """
+        soc after each of charge(gain) + leak(duration) for gains in turn, without changing soc.
+        Closed form of the clamped sum: x[n] = S[n] + min(soc, capacity - leak - max(S[1..n])), S: cumsum of gain - leak
+        """
+        leak = self.leak_rate * seconds(duration)
+        s = np.cumsum(np.asarray(gains, dtype=float) - leak)
+        return s + np.minimum(self.soc, self.capacity - leak - np.maximum.accumulate(s))
+
+
+    def settle(self, gains, soc, duration):
+        # set soc to the projection of 'gains' (see project), counting the energy clipped on the way
+        leak = self.leak_rate * seconds(duration)
+        self.clipped += max(self.soc + float(np.sum(gains)) - leak * len(gains) - soc, 0.0)
+        self.soc = float(soc)
+        
+        
+        
+
+
+class FleetBattery:
+    """
+    Batteries of N nodes advanced together. Same variables as Battery, as arrays of shape (N,).
+    Scalars are broadcast to all nodes. 'idx' selects the nodes an operation applies to (default: all).
+    
+    """
+    
+    def __init__(self, soc, capacity, mini, standby, base_consume, n=None):
+        soc, capacity, mini, standby, base_consume = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in [soc, capacity, mini, standby, base_consume]])
+        if n is not None:
+            soc, capacity, mini, standby, base_consume = [np.broadcast_to(x, (n,)) for x in [soc, capacity, mini, standby, base_consume]]
+        self.soc = soc.copy()
+        self.capacity = capacity.copy()
+        self.mini = mini.copy()
+        self.standby = standby.copy()
+        self.leak_rate = self.capacity / self.standby
+        self.base_consume = base_consume.copy()
+        self.clipped = np.zeros(len(self.soc))
+        
+    
+    def __len__(self):
+        return len(self.soc)
+    
+    
+    def drain(self, drain, idx=slice(None)):
+        self.soc[idx] = np.maximum(self.soc[idx] - drain, 0)
+        
+        
+    def charge(self, gain, idx=slice(None)):
+        soc = self.soc[idx] + gain
+        self.clipped[idx] += np.maximum(soc - self.capacity[idx], 0)
+        self.soc[idx] = np.minimum(soc, self.capacity[idx])
         
         
-        
\ No newline at end of file
+    def leak(self, duration, idx=slice(None)):
+        self.soc[idx] -= self.leak_rate[idx] * seconds(duration)
@@ -1,4 +1,102 @@
-import pandas as pd
+import copy
+import numpy as np
+from collections import OrderedDict
+from simulator.Timer import to_epoch, from_epoch
+from simulator.trace import Trace
+
+
+
+class EnergyIndex:
+    """
+    Cumulative energy of one trace column at one resolution, built once per trace.
+    Steps are the rows of the trace at its own resolution, or the broken-down steps of a finer resolution.
+    C(g) is the energy of steps [0, g), so the sum of any window is C(end) - C(start) in O(1).
+
+    Variables:
+        'gstart': first step of each row
+        'rate': energy per step of each row
+        'cum': energy before each row, cum[r] = C(gstart[r])
+        'n': number of steps
+    """
+
+    def __init__(self, time, values, trace_step, step):
+        if step == trace_step:      # native: one step per row
+            self.gstart = np.arange(len(time), dtype=np.int64)
+            self.n = len(time)
+        else:
+            t0 = int(time[0])
+            self.gstart = -((t0 - time) // step)
+            self.n = (int(time[-1]) + trace_step - t0) // step
+        gend = np.append(self.gstart[1:], self.n)
+        self.rate = np.asarray(values, dtype=float) * (step / trace_step)
+        self.cum = np.concatenate([[0.], np.cumsum((gend - self.gstart) * self.rate)])
+        self.monotone = bool((self.rate >= 0).all())
+
+
+    def __call__(self, g):
+        # C(g), vectorized
+        g = np.clip(g, 0, self.n)
+        r = np.maximum(np.searchsorted(self.gstart, g, side='right') - 1, 0)
+        return self.cum[r] + (g - self.gstart[r]) * self.rate[r]
+
+
+    def ceil_above(self, v):
+        # approx. smallest step m with C(m) > v (n+1 if none), needs a monotone C
+        rows = len(self.rate)
+        r = np.searchsorted(self.cum, v, side='right') - 1
+        rc = np.clip(r, 0, rows-1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            j = np.floor((v - self.cum[rc]) / self.rate[rc]) + 1
+        m = self.gstart[rc] + np.where(np.isfinite(j), np.clip(j, 0, self.n+1), 0).astype(np.int64)
+        return np.where(r < 0, 0, np.where(r >= rows, self.n+1, np.minimum(m, self.n+1)))
+
+
+
+class EnergyPyramid:
+    """
+    Aggregate levels over an EnergyIndex: for blocks of B steps (aligned to step 0), the energy sum of each block
+    and the smallest energy of one step in it. Levels with blocks at least a trace row long are precomputed
+    ('levels': B -> (sums, mins)); finer blocks span at most two rows and are computed on demand.
+    """
+
+    def __init__(self, index, blocks):
+        self.index = index
+        self.row_steps = int(np.median(np.diff(index.gstart))) if len(index.gstart) > 1 else 1
+        self.levels = {}
+        for B in sorted(set(blocks)):
+            if B >= self.row_steps:
+                edges = np.minimum(np.arange(-(-index.n // B) + 1, dtype=np.int64) * B, index.n)
+                self.levels[B] = (np.diff(index(edges)), self.block_min(edges[:-1], edges[1:]))
+
+
+    def row(self, g):
+        return np.maximum(np.searchsorted(self.index.gstart, g, side='right') - 1, 0)
+
+
+    def block_min(self, s, e):
+        # smallest step energy of contiguous blocks [s, e)
+        r0, r1 = self.row(s), self.row(np.maximum(e - 1, s))
+        rate = self.index.rate
+        if (r1 - r0).max(initial=0) <= 1:
+            return np.minimum(rate[r0], rate[r1])
+        return np.minimum(np.minimum.reduceat(rate[:r1[-1]+1], r0), rate[r1])
+
+
+    def query(self, s, B, e):
+        """
+        Blocks of B steps from step s (a multiple of B, or the first level) up to step e: start step, steps, sum, min.
+        """
+        starts = np.arange(s, e, B, dtype=np.int64)
+        ends = np.minimum(starts + B, e)
+        sums = self.index(ends) - self.index(starts)
+        if B in self.levels and 0 == s % B:
+            full = ends - starts == B
+            mins = np.where(full, self.levels[B][1][np.minimum(starts // B, len(self.levels[B][1]) - 1)], 0.0)
+            if not full.all():
+                mins[~full] = self.block_min(starts[~full], ends[~full])
+        else:
+            mins = self.block_min(starts, ends)
+        return starts, ends - starts, sums, mins
 
 
 
@@ -7,84 +105,272 @@ class Simulator:
     Simulator for energy generation, both predicted and true energy.
     If 'start' and 'end' are given, that period's energy will return. Otherwise, a period of 5 days energy.
     'dc_alpha' is a discount factor for adjusting the solar panel size. If set to 1, the soar panel size is the default.
-    
+
+    The trace is kept as numpy arrays indexed by epoch seconds, so a window lookup is a binary search instead of a mask over the whole index.
+    'resolution' is 'hour', 'minute', 'second' or a step size in seconds. Resolutions finer than the trace are
+    broken down lazily per window (each step gets its row's energy * step/trace_step) and cached per chunk:
+    'chunk_size' is the chunk length in seconds and 'cache_chunks' the number of chunks kept (LRU).
+    'trace' is an already loaded Trace (e.g. memory-mapped and shared between processes). If given, 'energy_pred_path' is not read.
+    'cache': map the csv through its binary cache (Trace.cached) instead of parsing it on every construction.
+    'estimator': prediction source, e.g. EnsembleEstimator. Its blended column is added to the trace once and replaces 'energy_pred_col'.
+        The blend of a row only uses actuals at least 'window' before it, so a decision never reads one built on actuals after it.
+    'window': prediction window of load_energy_* and of the policies' lookahead, seconds.
+
+    lookahead() reads a horizon at mixed resolution, fine near-term and coarse far-term, from an energy pyramid
+    (second -> minute -> hour -> day sums and mins, see EnergyPyramid), so its cost depends on the number of blocks only.
+    It is a standalone API for planners and analyses: the policies read the cumulative energy index (energy_index).
+
     """
-    def __init__(self, timer, energy_pred_path, dc_alpha, energy_true_col, energy_pred_col):
+    resolutions = {'hour': 3600, 'minute': 60, 'second': 1}
+    spans = [(3600, 1), (24*3600, 60), (7*24*3600, 3600), (None, 24*3600)]    # lookahead: (until, block), seconds
+
+    def __init__(self, timer, energy_pred_path, dc_alpha, energy_true_col, energy_pred_col, chunk_size=24*3600, cache_chunks=64, trace=None, cache=True, estimator=None, window=5*24*3600):
         self.energy_pred_path = energy_pred_path
         self.timer            = timer
         self.dc_alpha         = dc_alpha
         self.energy_pred_col  = energy_pred_col  #'DC_prediction'
         self.energy_true_col  = energy_true_col  #'dc_power__422'
-        self.energy_hour      = None             # dataframe of hourly data: pred & true
-        self.energy_second    = None             # dataframe of sencondly data: pred & true
-        self.load_energy_pred(resolution='hour')        
-        self.load_energy_pred(resolution='second')        
-       
- 
-    def load_energy_hour(self, start, end, column):
-        if self.energy_hour is not None:
-            df = self.energy_hour
-        else:
-            energy_pred = pd.read_csv(self.energy_pred_path)
-            df = energy_pred #.iloc[:,[0,-2,-1]]
-            df['time'] = pd.to_datetime(df['Time'])
-            df = df.set_index('time')
-            #df = df.drop('measured_on',axis=1)
-            self.energy_hour = df
-            
-        res = df[ (df.index >= start) & (df.index < end) ][column]
+        self.trace            = trace            # trace arrays: pred & true
+        self.time             = None             # epoch second of each trace row
+        self.step             = None             # trace step size, second
+        self.frame            = None             # dataframe view of the trace, built on demand
+        self.chunk_size       = chunk_size
+        self.cache_chunks     = cache_chunks
+        self.chunks           = OrderedDict()    # (column, step, chunk) -> broken-down energy, LRU
+        self.indexes          = {}               # (column, step) -> EnergyIndex
+        self.cache            = cache
+        self.estimator        = estimator
+        self.window           = window           # prediction window, second
+        self.pyramids         = {}               # (column, step) -> EnergyPyramid
+        self.load_trace()
+
+
+    def load_trace(self):
+        if self.trace is None:
+            self.trace = Trace.cached(self.energy_pred_path) if self.cache else Trace.from_csv(self.energy_pred_path)
+        self.time = self.trace.time
+        self.step = int(np.median(np.diff(self.time))) if len(self.time) > 1 else 3600
+        if self.estimator is not None:          # weights lagged by the prediction window: no decision reads later actuals
+            self.energy_pred_col = self.estimator.attach(self.trace, lead=-(-self.window // self.step))
+        self.frame = None
+        self.chunks.clear()
+        self.indexes = {}
+        self.pyramids = {}
+
+
+    def fork(self, timer, dc_alpha=None):
+        # simulator on its own timer sharing the trace and its indexes, e.g. for a branch of a run
+        sim = copy.copy(self)
+        sim.timer = timer
+        if dc_alpha is not None:
+            sim.dc_alpha = dc_alpha
+        return sim
+
+
+    @property
+    def energy_hour(self):
+        # dataframe of the trace: pred & true
+        if self.frame is None:
+            self.frame = self.trace.to_frame()
+        return self.frame
+
+
+    @property
+    def start_time(self):
+        return from_epoch(self.time[0])
+
+
+    @property
+    def end_time(self):
+        # time of the last trace row
+        return from_epoch(self.time[-1])
+
+
+    def column(self, column):
+        return self.trace.column(column)
+
+
+    def res_step(self, resolution):
+        # resolution -> step size in seconds
+        step = self.resolutions.get(resolution, resolution)
+        if not isinstance(step, (int, np.integer)) or step <= 0:
+            raise ValueError("resolution not recognized. ['hour','minute','second'] or step in seconds")
+        if step > self.step:
+            raise ValueError("resolution coarser than the energy trace: %ss > %ss" % (step, self.step))
+        return int(step)
+
+
+    def chunk(self, column, step, k):
+        # energy of the k-th chunk of a broken-down column
+        key = (column, step, k)
+        if key in self.chunks:
+            self.chunks.move_to_end(key)
+            return self.chunks[key]
+        n = max(1, self.chunk_size // step)
+        n_grid = (int(self.time[-1]) + self.step - int(self.time[0])) // step
+        grid = self.time[0] + step * np.arange(k*n, min((k+1)*n, n_grid), dtype=np.int64)
+        rows = np.searchsorted(self.time, grid, side='right') - 1        # row covering each step (ffill)
+        res = self.column(column)[rows] * (step / self.step)
+        self.chunks[key] = res
+        if len(self.chunks) > self.cache_chunks:
+            self.chunks.popitem(last=False)
         return res
-        
-        
+
+
+    def load_energy_window(self, start, end, column, resolution='hour'):
+        # energy in [start, end) at the given resolution
+        step = self.res_step(resolution)
+        start, end = to_epoch(start), to_epoch(end)
+        if step == self.step:
+            i0, i1 = np.searchsorted(self.time, [start, end])
+            return self.column(column)[i0:i1]
+
+        # break down trace rows into steps, chunk by chunk
+        t0 = int(self.time[0])
+        n_grid = (int(self.time[-1]) + self.step - t0) // step
+        g0 = min(max(-((t0 - start) // step), 0), n_grid)     # first step >= start
+        g1 = min(max(-((t0 - end) // step), g0), n_grid)      # first step >= end
+        if g1 <= g0:
+            return np.empty(0)
+        n = max(1, self.chunk_size // step)
+        parts = [self.chunk(column, step, k) for k in range(g0 // n, (g1 - 1) // n + 1)]
+        res = parts[0] if 1 == len(parts) else np.concatenate(parts)
+        off = (g0 // n) * n
+        return res[g0-off : g1-off]
+
+
+    def energy_index(self, column, resolution='hour'):
+        # cumulative energy index, built on first use
+        step = self.res_step(resolution)
+        if (column, step) not in self.indexes:
+            self.indexes[(column, step)] = EnergyIndex(self.time, self.column(column), self.step, step)
+        return self.indexes[(column, step)]
+
+
+    def pyramid(self, column, resolution='hour'):
+        # aggregate levels of the energy index, built on first use
+        step = self.res_step(resolution)
+        if (column, step) not in self.pyramids:
+            blocks = [b // step for _, b in self.spans if b >= step and 0 == b % step]
+            self.pyramids[(column, step)] = EnergyPyramid(self.energy_index(column, resolution), blocks)
+        return self.pyramids[(column, step)]
+
+
+    def lookahead(self, start=None, horizon=None, resolution='hour', column=None, spans=None):
+        """
+        Energy over [start, start+horizon) in blocks that grow with the distance from start.
+        spans: (until, block) pairs in seconds, blocks dividing the next ones, e.g. the default
+            per second for the first hour, per minute until a day, per hour until a week, per day after.
+            Blocks finer than 'resolution' are skipped.
+        horizon: seconds, 'None': the prediction window. Past the window, a blended prediction (estimator) may use
+            actuals after 'start'.
+        return:
+            { 'time': block start (epoch second), 'steps': block length in steps,
+              'sum': energy of the block, 'min': smallest energy of one step in the block }
+        """
+        column = column or self.energy_pred_col
+        start = self.timer.now if start is None else to_epoch(start)
+        horizon = self.window if horizon is None else horizon
+        step = self.res_step(resolution)
+        spans = [(u, b // step) for u, b in (spans or self.spans) if b >= step and 0 == b % step]
+        pyr = self.pyramid(column, resolution)
+        g0, end = self.grid_index(start, resolution), self.grid_index(start + horizon, resolution)
+        g, parts = g0, []
+        for i, (until, B) in enumerate(spans):
+            limit = end if until is None else min(end, g0 + until // step)
+            if i + 1 < len(spans):       # finish at a block boundary of the next level
+                nb = spans[i+1][1]
+                limit = min(end, -(-max(limit, g) // nb) * nb)
+            if limit > g:
+                parts.append(pyr.query(g, B, limit))
+                g = limit
+        if not parts:
+            return {'time': np.empty(0, dtype=np.int64), 'steps': np.empty(0, dtype=np.int64), 'sum': np.empty(0), 'min': np.empty(0)}
+        starts, steps, sums, mins = [np.concatenate(x) for x in zip(*parts)]
+        t0 = int(self.time[0]) if step != self.step else None
+        times = t0 + starts * step if t0 is not None else self.time[np.minimum(starts, len(self.time)-1)]
+        return {'time': times, 'steps': steps, 'sum': sums * self.dc_alpha, 'min': mins * self.dc_alpha}
+
+
+    def grid_index(self, t, resolution='hour'):
+        # first step at or after time t (timestamp or epoch second)
+        step = self.res_step(resolution)
+        t = t if isinstance(t, (int, np.integer)) else to_epoch(t)
+        if step == self.step:
+            return int(np.searchsorted(self.time, t))
+        n = (int(self.time[-1]) + self.step - int(self.time[0])) // step
+        return min(max(-((int(self.time[0]) - t) // step), 0), n)
+
+
+    def window_sum(self, start, end, column, resolution='hour'):
+        # energy in [start, end) in O(1)
+        idx = self.energy_index(column, resolution)
+        return (idx(self.grid_index(end, resolution)) - idx(self.grid_index(start, resolution))) * self.dc_alpha
+
+
+    def first_above(self, column, resolution, g0, lo, hi, soc, req, scale=1.0):
+        """
+        First step g in [lo, hi) at which the accumulated energy soc + scale*dc_alpha*(C(g+1) - C(g0)) exceeds req, -1 if none.
+        Vectorized over lo, soc, req and scale. A binary search on the index when energy is non-negative.
+        """
+        idx = self.energy_index(column, resolution)
+        lo, soc, req = np.asarray(lo, dtype=np.int64), np.asarray(soc, dtype=float), np.asarray(req, dtype=float)
+        a, base = np.asarray(scale, dtype=float) * self.dc_alpha, idx(g0)
+        ok = lambda g: soc + a * (idx(g+1) - base) > req
+        if not idx.monotone:
+            steps = np.arange(g0, hi)
+            enough = (soc[...,None] + a[...,None] * (idx(steps+1) - base) > req[...,None]) & (steps >= lo[...,None])
+            return np.where(enough.any(axis=-1), g0 + enough.argmax(axis=-1), -1)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            v = base + (req - soc) / a
+        g = np.clip(idx.ceil_above(np.where(np.isnan(v), np.inf, v)) - 1, lo, hi)
+        while True:      # fix float rounding of the search, at most a step or two
+            move = ((g < hi) & ~ok(g)).astype(np.int64) - ((g > lo) & ok(g-1))
+            if not move.any():
+                break
+            g = g + move
+        return np.where(g < hi, g, -1)
+
+
+    def load_energy_steps(self, start, n, resolution='hour', column=None):
+        # energy read by n consecutive steps from start: the first value of each [t, t+step)
+        if not column:
+            column = self.energy_true_col
+        step = self.res_step(resolution)
+        t = to_epoch(start) + step * np.arange(n, dtype=np.int64)
+        if step != self.step:
+            t0 = int(self.time[0])
+            t = t0 - ((t0 - t) // step) * step          # first broken-down step at or after t
+            rows = np.searchsorted(self.time, t, side='right') - 1
+            return self.column(column)[np.maximum(rows, 0)] * (step / self.step) * self.dc_alpha
+        rows = np.searchsorted(self.time, t)
+        return self.column(column)[np.minimum(rows, len(self.time)-1)] * self.dc_alpha
+
+
+    def load_energy_hour(self, start, end, column):
+        return self.load_energy_window(start, end, column, resolution='hour')
+
+
     def load_energy_second(self, start, end, column):
-        if self.energy_second is not None:
-            df = self.energy_second
-        else:
-            # load hourly data
-            if self.energy_hour is None:
-                self.load_energy_hour(start, end, column)
-            hour_data = self.energy_hour
-            
-            # break down hour into second
-            df = hour_data[[self.energy_pred_col, self.energy_true_col]].copy()
-            df[[self.energy_true_col, self.energy_pred_col]] = df[[self.energy_true_col, self.energy_pred_col]] / 3600
-            
-            # pad one row to break down the last row
-            pad_row = df.tail(1).copy()
-            pad_row.index = [pd.to_datetime(df.index[-1] + pd.Timedelta(hours=1))]    
-            df = pd.concat([df, pad_row])
-            
-            df = df.resample('S').fillna(method='ffill').interpolate()
-            df = df.drop(index=pad_row.index, axis=0)
-            self.energy_second = df
-        
-        res = df[ (df.index >= start) & (df.index < end) ][column]
-        return res
-        
-        
+        return self.load_energy_window(start, end, column, resolution='second')
+
+
     def load_energy_driver(self, column, start=None, end=None, resolution='hour'):
-        if not start:        
-            start = self.timer.curr_time        # default start time is curr
+        if not start:
+            start = self.timer.now              # default start time is curr
         if not end:
-            end = start + pd.Timedelta(days=5)  # default end time is in 5 days
-        if 'hour' == resolution:
-            return self.load_energy_hour(start, end, column).values * self.dc_alpha
-        
-        return self.load_energy_second(start, end, column).values * self.dc_alpha
-        
-        
+            end = to_epoch(start) + self.window # default end time is in 5 days
+        return self.load_energy_window(start, end, column, resolution) * self.dc_alpha
+
+
     def load_energy_pred(self, start=None, end=None, resolution='hour', column=None):
         if not column:
             column = self.energy_pred_col
         return self.load_energy_driver(column=column, start=start, end=end, resolution=resolution)
-        
-        
+
+
     def load_energy_true(self, start=None, end=None, resolution='hour', column=None):
         if not column:
             column = self.energy_true_col
         return self.load_energy_driver(column=column, start=start, end=end, resolution=resolution)
-        
-    
-    
-    
-    
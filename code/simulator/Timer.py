@@ -1,25 +1,71 @@
-import pandas as pd
+import numpy as np
+from datetime import datetime, timezone
 
 
 
 class Timer:
+    """
+    Simulation clock. Time is kept as integer seconds since epoch: 'now' (current) and 'start' (initial),
+    moved by forward() / backward() with seconds or a timedelta, so the control loop allocates no time objects.
+    'curr_time' / 'init_time' give the times as timestamps for the API and logs; a timer started from
+    an epoch int gives ints back (on-device runtime, no pandas).
+    """
+
     def __init__(self, init_time, curr_time=None):
-        self.init_time = init_time
-        self.curr_time = init_time if not curr_time else curr_time
+        self.ints = isinstance(init_time, (int, np.integer))     # ints in, ints out
+        self.start = to_epoch(init_time)
+        self.now = self.start if not curr_time else to_epoch(curr_time)
+
+
+    @property
+    def init_time(self):
+        return self.start if self.ints else from_epoch(self.start)
+
+
+    @property
+    def curr_time(self):
+        return self.now if self.ints else from_epoch(self.now)
+
+
+    @curr_time.setter
+    def curr_time(self, t):
+        self.now = to_epoch(t)
+
         
     def step(self, size=1):
         # size unit: second
-        self.curr_time += pd.Timedelta(seconds=size)
+        self.now += int(size)
     
     def forward(self, step):
-        self.curr_time += step
+        self.now += int(seconds(step))
 
 
     def backward(self, step):
-        self.curr_time -= step
+        self.now -= int(seconds(step))
+
 
 
+def seconds(d):
+    # duration -> seconds: a number of seconds, datetime.timedelta or pd.Timedelta
+    return d if isinstance(d, (int, float, np.integer, np.floating)) else d.total_seconds()
 
 
+def to_epoch(t):
+    # timestamp -> integer seconds since epoch, without importing pandas (naive times are UTC)
+    if isinstance(t, (int, np.integer)):
+        return int(t)
+    if hasattr(t, 'value'):                 # pd.Timestamp, ns
+        return t.value // 10**9
+    if isinstance(t, np.datetime64):
+        return int(t.astype('datetime64[s]').astype(np.int64))
+    if isinstance(t, str):
+        t = datetime.fromisoformat(t)
+    if t.tzinfo is None:
+        t = t.replace(tzinfo=timezone.utc)
+    return int(t.timestamp() // 1)
 
 
+def from_epoch(sec):
+    # integer seconds since epoch -> timestamp
+    import pandas as pd
+    return pd.Timestamp(int(sec), unit='s')
@@ -0,0 +1,138 @@
+import numpy as np
+from collections import deque
+
+
+
+class EnsembleEstimator:
+    """
+    DC power gain estimator: weighted blend of the member predictions of the trace (dc_pred_*).
+    Each member's weight is the inverse of its mean squared error against 'true_col' over a sliding window
+    of past rows, so the members that did best recently count most.
+
+    Variables:
+        'members': prediction columns to blend, each must be in the trace.
+            'None': every 'dc_pred_*' column of the trace being fitted, except the derived ones (trace.derived, e.g. blends)
+        'true_col': actual dc power gain
+        'window': number of past rows in the error window
+        'lag': rows between a row and the newest actual its weights may use. 0: row t uses the errors of rows before t
+            A decision at row r reading the blend up to row r+h must only see actuals of rows before r, so 'lag' >= h:
+            attach() raises it to the reader's lookahead ('lead'), Simulator(estimator=...) passes its prediction window
+        'name': column of the blended prediction in the trace, one name per estimator setting
+
+    fit() blends the whole trace at once with windowed prefix sums of the errors and keeps the result in the trace
+    as column 'name'. The simulator then treats it as any other prediction column, and the energy index over it is built once.
+    fit() and attach() modify the trace: they add (or overwrite) column 'name' in trace.data and record it in
+    trace.derived, so every simulator sharing the trace object sees the blend.
+    update() / predict() do the same one row at a time with a ring buffer of errors, O(1) per row, for gains that arrive
+    online (e.g. on a device); the Simulator does not use them.
+    Rows without error history weigh all members equally.
+    """
+
+    def __init__(self, members=None, true_col='dc_actual', window=24*7, lag=0, eps=1e-9, name='dc_pred_ens'):
+        self.members = None if members is None else list(members)
+        self.true_col = true_col
+        self.window = window
+        self.lag = lag
+        self.eps = eps
+        self.name = name
+        self.weights_ = None                 # (rows, members) weights of the fitted trace
+        self.lag_ = None                     # lag of the fitted trace, rows
+        self.reset()
+
+
+    def member_cols(self, trace):
+        # member columns of this trace
+        if self.members is None:
+            return [c for c in trace.columns if c.startswith('dc_pred_') and c != self.name and c not in trace.derived]
+        missing = [c for c in self.members if c not in trace.data]
+        if missing:
+            raise ValueError("members %s not in the trace, columns: %s" % (missing, trace.columns))
+        return self.members
+
+
+    def weights_from(self, err_sum, count):
+        # windowed squared error sums -> normalized weights, equal weights without history
+        k = err_sum.shape[-1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            w = 1.0 / (err_sum / count[..., None] + self.eps)
+        w = np.where(count[..., None] > 0, w, 1.0)
+        return w / w.sum(axis=-1, keepdims=True) if k else w
+
+
+    def fit(self, trace, lag=None):
+        """
+        Blend every row of the trace and store it as column 'name'. Returns the blended array.
+        lag: rows, 'None': self.lag
+        """
+        lag = self.lag if lag is None else lag
+        cols = self.member_cols(trace)
+        preds = np.column_stack([np.asarray(trace.column(c), dtype=float) for c in cols])
+        err = (preds - np.asarray(trace.column(self.true_col), dtype=float)[:, None]) ** 2
+        cum = np.vstack([np.zeros((1, len(cols))), np.cumsum(err, axis=0)])
+
+        # window of row t: rows [t-lag-window, t-lag)
+        t = np.arange(len(preds))
+        hi = np.clip(t - lag, 0, len(preds))
+        lo = np.clip(hi - self.window, 0, None)
+        self.weights_ = self.weights_from(cum[hi] - cum[lo], (hi - lo).astype(float))
+        blend = (self.weights_ * preds).sum(axis=1)
+        trace.data[self.name] = blend
+        trace.derived[self.name] = lag
+        self.lag_ = lag
+        return blend
+
+
+    def attach(self, trace, lead=0):
+        """
+        Blended column of the trace, fitted once per trace.
+        lead: rows ahead of the decision row the column is read at, the fit uses lag >= lead
+        """
+        lag = max(self.lag, lead)
+        if trace.derived.get(self.name, -1) < lag:
+            self.fit(trace, lag)
+        return self.name
+
+
+    # ---------- online ----------
+
+    def reset(self, k=None):
+        # k: number of members, 'None': len(members)
+        k = (0 if self.members is None else len(self.members)) if k is None else k
+        self.buf = np.zeros((self.window, k))      # ring buffer of squared errors
+        self.pos = 0
+        self.count = 0
+        self.err_sum = np.zeros(k)
+        self.pending = deque()                     # errors waiting 'lag' rows before they count
+
+
+    def update(self, preds, actual):
+        """
+        Add the errors of one row once its actual gain is known. preds: member predictions of the row.
+        """
+        preds = np.asarray(preds, dtype=float)
+        if self.buf.shape[1] != len(preds):
+            self.reset(len(preds))
+        self.pending.append((preds - actual) ** 2)
+        if len(self.pending) <= self.lag:
+            return
+        e = self.pending.popleft()
+        if self.count == self.window:              # drop the oldest row of the window
+            self.err_sum -= self.buf[self.pos]
+        else:
+            self.count += 1
+        self.buf[self.pos] = e
+        self.err_sum += e
+        self.pos = (self.pos + 1) % self.window
+
+
+    def weights(self):
+        # current weights, from the rows added by update()
+        return self.weights_from(self.err_sum, np.asarray(float(self.count)))
+
+
+    def predict(self, preds):
+        # blend of one row's member predictions with the current weights
+        preds = np.asarray(preds, dtype=float)
+        if self.buf.shape[1] != len(preds):
+            return float(preds.mean())
+        return float((self.weights() * preds).sum())
@@ -0,0 +1,120 @@
+import numpy as np
+
+
+
+class EnergyScenarios:
+    """
+    Sampled energy trajectories around the prediction, for planning under forecast uncertainty.
+    A trajectory is the predicted energy of each trace row plus a noise term, at least 0:
+        'members': noise = z * spread of the ensemble members (dc_pred_*) of the row, z ~ N(0, 1) correlated
+            from row to row with 'rho' (AR(1)), so forecast errors persist over hours as weather does.
+            The z paths are drawn once and reused by every decision (common random numbers): decisions differ by
+            the forecast and its spread only, and a decision costs no random draws
+        'residuals': noise = residual (energy_true_col - prediction) of the same row some whole days earlier,
+            one random day per trajectory among the last 'days' days fully in the past (day-block bootstrap)
+
+    Variables:
+        'samples': number of trajectories
+        'members': ensemble columns of 'members', each must be in the trace.
+            'None': every 'dc_pred_*' column of the trace except the derived ones (trace.derived, e.g. an EnsembleEstimator blend)
+        'seed': 'members' paths depend on the seed only, 'residuals' days on (seed, step), so reruns and forks draw the same ones
+
+    sample() works on trace rows, not steps: a window holds one value per row whatever the resolution,
+    and energy within a row is linear in the steps (each step gets its row's energy * step/trace_step).
+    """
+
+    def __init__(self, source='members', samples=1000, members=None, rho=0.9, days=14, seed=0):
+        if source not in ['members', 'residuals']:
+            raise ValueError("source not recognized. ['members','residuals']")
+        self.source = source
+        self.samples = samples
+        self.members = None if members is None else list(members)
+        self.rho = rho
+        self.days = days
+        self.seed = seed
+        self.paths = np.empty((samples, 0))       # AR(1) z paths of 'members', grown on demand
+
+
+    def z(self, R):
+        # (samples, R) standard normal AR(1) paths, the first R rows of the same paths for any R
+        if self.paths.shape[1] < R:
+            R = max(R, 2 * self.paths.shape[1])
+            lag = np.subtract.outer(np.arange(R), np.arange(R))
+            L = np.where(lag >= 0, self.rho ** np.maximum(lag, 0), 0.0) * np.sqrt(1 - self.rho**2)
+            L[:, 0] = self.rho ** np.arange(R)                    # stationary start
+            self.paths = np.random.default_rng(self.seed).standard_normal((self.samples, R)) @ L.T    # one product
+        return self.paths[:, :R]
+
+
+    def member_cols(self, simulator):
+        # ensemble columns of the simulator's trace
+        trace = simulator.trace
+        if self.members is None:
+            return [c for c in trace.columns if c.startswith('dc_pred_') and c not in trace.derived]
+        missing = [c for c in self.members if c not in trace.data]
+        if missing:
+            raise ValueError("members %s not in the trace, columns: %s" % (missing, trace.columns))
+        return self.members
+
+
+    def noise(self, simulator, column, rows, g0):
+        # (samples, rows) noise of the trace rows 'rows', in trace-row energy
+        R = len(rows)
+        if 'members' == self.source:
+            preds = np.column_stack([np.asarray(simulator.column(c), dtype=float)[rows] for c in self.member_cols(simulator)])
+            return self.z(R)[:, :R] * preds.std(axis=1)
+
+        # residuals: whole days back, all rows strictly before the first row of the window
+        per_day = max(1, 24*3600 // simulator.step)
+        back = -(-R // per_day)                                  # days until the window is in the past
+        avail = min(self.days, (rows[0] - back * per_day) // per_day + 1)
+        if avail <= 0:                                           # no history yet
+            return np.zeros((self.samples, R))
+        shift = (back + np.random.default_rng([self.seed, int(g0)]).integers(0, avail, self.samples)) * per_day
+        ix = rows[None, :] - shift[:, None]
+        return np.asarray(simulator.column(simulator.energy_true_col), dtype=float)[ix] - np.asarray(simulator.column(column), dtype=float)[ix]
+
+
+    def sample(self, simulator, column, resolution, g0, n_steps):
+        """
+        Trajectories of the energy over steps [g0, g0+n_steps) of 'column', before dc_alpha.
+        return: 'bounds' (R+1,) step offsets from g0 of the row edges in the window, 'cum' (samples, R+1) energy up to each edge
+        """
+        if n_steps <= 0:
+            return np.zeros(1, dtype=np.int64), np.zeros((self.samples, 1))
+        idx = simulator.energy_index(column, resolution)
+        r0 = max(np.searchsorted(idx.gstart, g0, side='right') - 1, 0)
+        r1 = max(np.searchsorted(idx.gstart, g0 + n_steps - 1, side='right') - 1, 0)
+        rows = np.arange(r0, r1 + 1)
+        bounds = np.concatenate([[g0], idx.gstart[r0+1:r1+1], [g0 + n_steps]]) - g0
+        scale = simulator.res_step(resolution) / simulator.step           # row energy -> step energy
+        rate = np.maximum(idx.rate[rows][None, :] + self.noise(simulator, column, rows, g0) * scale, 0.0)
+        cum = np.zeros((self.samples, len(rows) + 1))
+        np.cumsum(rate * np.diff(bounds)[None, :], axis=1, out=cum[:, 1:])
+        return bounds, cum
+
+
+    @staticmethod
+    def first_enough(bounds, cum, need, lo, hi, quantile):
+        """
+        First step t in [lo, hi) from which soc + energy(t+1) > req holds in at least 1 - quantile of the trajectories,
+        -1 if none. Energy never decreases along a trajectory, so each trajectory has one first step t_k and
+        the answer is an order statistic of the t_k.
+            'cum': (samples, R+1) energy at the row edges (sample), 'need': (nodes,) energy needed, 'lo', 'hi': (nodes,)
+        Memory: one (nodes, samples, R+1) mask.
+        """
+        cum = cum[None]
+        over = cum > need[:, None, None]
+        j = over.argmax(axis=2)
+        jj = np.maximum(j, 1)
+        c0 = np.take_along_axis(cum, (jj - 1)[..., None], axis=2)[..., 0]
+        c1 = np.take_along_axis(cum, jj[..., None], axis=2)[..., 0]
+        steps = bounds[jj] - bounds[jj-1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            m = np.floor((need[:, None] - c0) / ((c1 - c0) / steps)) + 1       # steps into the row until energy > need
+        m = np.clip(np.nan_to_num(m, nan=1.0), 1, np.maximum(steps, 1))
+        t = np.where(0 == j, 0, bounds[jj-1] + m - 1)
+        t = np.where(over.any(axis=2), t, np.inf)
+        k = min(cum.shape[1] - 1, max(0, int(np.ceil((1 - quantile) * cum.shape[1])) - 1))
+        t = np.maximum(np.partition(t, k, axis=1)[:, k], lo)
+        return np.where(t < hi, t, -1).astype(np.int64)
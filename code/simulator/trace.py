@@ -0,0 +1,205 @@
+import os, json, shutil, hashlib
+import numpy as np
+
+
+
+class Trace:
+    """
+    Energy trace as numpy arrays.
+        'time': epoch second of each row
+        'data': column -> float array
+        'derived': column -> lag (rows) of the columns computed from the others in place, e.g. EnsembleEstimator blends
+
+    A trace can be saved to a directory of .npy files (one per column) and loaded back memory-mapped,
+    so several processes can read one copy of the data.
+
+    Trace.cached(csv) converts a csv once to such a directory next to it ('<csv>.trace') and maps it afterwards.
+    The cache is rebuilt when the csv changes (size, or content hash when only mtime changed).
+    If it cannot be written, the csv is parsed instead.
+    The conversion reads the csv in chunks, so traces larger than memory can be converted.
+    pandas is imported only to read csv files or build frames; loading a saved trace needs numpy alone.
+    """
+
+    def __init__(self, time, data):
+        self.time = time
+        self.data = data
+        self.derived = {}
+
+
+    @classmethod
+    def from_frame(cls, df, time_col='Time'):
+        import pandas as pd
+        time = pd.to_datetime(df[time_col]).values.astype('datetime64[s]').astype(np.int64)
+        data = {c: df[c].to_numpy(dtype=float) for c in df.columns if c != time_col and pd.api.types.is_numeric_dtype(df[c])}
+        return cls(time, data)
+
+
+    @classmethod
+    def from_csv(cls, path, time_col='Time'):
+        import pandas as pd
+        return cls.from_frame(pd.read_csv(path), time_col=time_col)
+
+
+    @staticmethod
+    def convert_csv(src, dst, time_col='Time', chunksize=2**20):
+        """
+        Streaming csv -> .npy directory, same layout as save(). Reads 'chunksize' rows at a time;
+        numeric columns are decided on the first chunk.
+        """
+        import pandas as pd
+        os.makedirs(dst, exist_ok=True)
+        files, columns, n = {}, None, 0
+        try:
+            for df in pd.read_csv(src, chunksize=chunksize):
+                if columns is None:
+                    columns = [c for c in df.columns if c != time_col and pd.api.types.is_numeric_dtype(df[c])]
+                    files['time'] = open(os.path.join(dst, 'time.raw'), 'wb')
+                    for i, c in enumerate(columns):
+                        files[i] = open(os.path.join(dst, '%d.raw' % i), 'wb')
+                files['time'].write(pd.to_datetime(df[time_col]).values.astype('datetime64[s]').astype(np.int64).tobytes())
+                for i, c in enumerate(columns):
+                    files[i].write(df[c].to_numpy(dtype=float).tobytes())
+                n += len(df)
+        finally:
+            for f in files.values():
+                f.close()
+        if columns is None:
+            raise ValueError("empty energy trace: %s" % src)
+
+        # raw column files -> .npy: header + data, copied block by block
+        for name, dtype in [('time', np.int64)] + [(i, np.float64) for i in range(len(columns))]:
+            raw = os.path.join(dst, '%s.raw' % name)
+            with open(os.path.join(dst, '%s.npy' % name), 'wb') as out, open(raw, 'rb') as f:
+                np.lib.format.write_array_header_1_0(out, {'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)), 'fortran_order': False, 'shape': (n,)})
+                shutil.copyfileobj(f, out, 2**24)
+            os.remove(raw)
+        with open(os.path.join(dst, 'columns.json'), 'w') as f:
+            json.dump(columns, f)
+        return dst
+
+
+    @staticmethod
+    def source_stamp(src, digest=False):
+        # identity of the source csv: size & mtime, + content hash when asked
+        st = os.stat(src)
+        stamp = {'source': os.path.abspath(src), 'size': st.st_size, 'mtime': st.st_mtime_ns}
+        if digest:
+            h = hashlib.sha1()
+            with open(src, 'rb') as f:
+                for block in iter(lambda: f.read(2**24), b''):
+                    h.update(block)
+            stamp['sha1'] = h.hexdigest()
+        return stamp
+
+
+    @classmethod
+    def fresh(cls, src, cache_dir, time_col='Time'):
+        # whether cache_dir holds the conversion of the current csv 'src'
+        meta_path = os.path.join(cache_dir, 'source.json')
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):                   # missing, or being swapped by another process
+            return False
+        stamp = cls.source_stamp(src)
+        if meta.get('time_col') != time_col or meta['size'] != stamp['size']:
+            return False
+        if meta['mtime'] == stamp['mtime']:
+            return True
+        stamp = cls.source_stamp(src, digest=True)
+        if meta.get('sha1') != stamp['sha1']:
+            return False
+        meta['mtime'] = stamp['mtime']                  # touched, not changed
+        try:
+            with open(meta_path, 'w') as f:
+                json.dump(meta, f)
+        except OSError:                                 # read-only cache, hashed again next time
+            pass
+        return True
+
+
+    @classmethod
+    def build_cache(cls, src, cache_dir=None, time_col='Time'):
+        """
+        Directory of the binary cache of csv 'src', converted first if missing or stale.
+        Several processes may build it at once: the one that loses the swap uses the winner's cache.
+        """
+        cache_dir = cache_dir or src + '.trace'
+        if cls.fresh(src, cache_dir, time_col):
+            return cache_dir
+
+        # (re)build in a temp dir, then swap in
+        stamp = cls.source_stamp(src, digest=True)
+        tmp = cache_dir + '.tmp%d' % os.getpid()
+        shutil.rmtree(tmp, ignore_errors=True)
+        try:
+            cls.convert_csv(src, tmp, time_col=time_col)
+            stamp['time_col'] = time_col
+            with open(os.path.join(tmp, 'source.json'), 'w') as f:
+                json.dump(stamp, f)
+            if cls.fresh(src, cache_dir, time_col):     # built meanwhile by another process
+                return cache_dir
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            try:
+                os.replace(tmp, cache_dir)
+            except OSError:
+                if not cls.fresh(src, cache_dir, time_col):     # not lost to another process's rebuild
+                    raise
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        return cache_dir
+
+
+    @classmethod
+    def cached(cls, src, cache_dir=None, time_col='Time', mmap=True):
+        """
+        Memory-mapped trace of csv 'src', see build_cache.
+        Falls back to parsing the csv when the cache cannot be written (e.g. read-only data directory)
+        or is swapped out by another process's rebuild while being loaded.
+        """
+        try:
+            return cls.load(cls.build_cache(src, cache_dir, time_col=time_col), mmap=mmap)
+        except OSError:
+            return cls.from_csv(src, time_col=time_col)
+
+
+    def save(self, path):
+        # one .npy per column + column list
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'time.npy'), self.time)
+        for i, c in enumerate(self.data):
+            np.save(os.path.join(path, '%d.npy' % i), self.data[c])
+        with open(os.path.join(path, 'columns.json'), 'w') as f:
+            json.dump(list(self.data), f)
+        return path
+
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        mode = 'r' if mmap else None
+        with open(os.path.join(path, 'columns.json'), 'r') as f:
+            columns = json.load(f)
+        time = np.load(os.path.join(path, 'time.npy'), mmap_mode=mode)
+        data = {c: np.load(os.path.join(path, '%d.npy' % i), mmap_mode=mode) for i, c in enumerate(columns)}
+        return cls(time, data)
+
+
+    @property
+    def columns(self):
+        return list(self.data)
+
+
+    def column(self, column):
+        return self.data[column]
+
+
+    def __len__(self):
+        return len(self.time)
+
+
+    def to_frame(self):
+        import pandas as pd
+        df = pd.DataFrame(self.data, index=pd.to_datetime(self.time, unit='s'))
+        df.index.name = 'time'
+        df.insert(0, 'Time', df.index.strftime('%Y-%m-%d %H:%M:%S'))
+        return df
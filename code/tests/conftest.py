@@ -0,0 +1,4 @@
+import os, sys
+
+CODE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CODE)
@@ -0,0 +1,56 @@
+"""
+Event-driven Scheduler (next-event jumps) against the per-step Scheduler: same schedule log, sensor profile and final soc.
+"""
+import os, json, shutil, contextlib, io
+import numpy as np
+import pandas as pd
+import pytest
+from simulator.EnergySim import Simulator
+from simulator.Timer import Timer
+from simulator.Battery import Battery
+from simulator.trace import Trace
+from scheduler.controller import Scheduler
+from scheduler.policy.policy_adap import Policy as policy_adap
+from scheduler.policy.policy_dyna import Policy as policy_dyna
+
+data = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+energy_pred_path = os.path.join(data, 'DC_pred.csv')
+trace = Trace.from_csv(energy_pred_path)
+
+
+def run(tmp_path, plc_cls, name, dc_alpha, capacity, soc, resolution, duration, event_driven):
+    sensor_path = shutil.copy(os.path.join(data, 'sensor_profile.json'), str(tmp_path / ('sensor_profile_%d.json' % event_driven)))
+    simul = Simulator(Timer(pd.Timestamp('2017-06-12')), None, dc_alpha, 'dc_actual', 'dc_pred_rf', trace=trace)
+    batt = Battery(soc=soc, capacity=capacity, mini=400, standby=24*30*3600, base_consume=30)
+    sch = Scheduler(simulator=simul, resolution=resolution, duration=duration, policy=plc_cls(name), sensor_path=sensor_path,
+                    sch_path=None, battery=batt, event_driven=event_driven)
+    with contextlib.redirect_stdout(io.StringIO()):         # policy warnings
+        sch.start()
+    with open(sensor_path, 'r') as f:
+        return sch.sch.to_df(), json.load(f), batt
+
+
+cases = [                       # dc_alpha, capacity, soc, resolution, duration; soc 50 runs out: 'soc not enough'
+    (0.1, 2000, 2000, 'hour', 12*24),
+    (0.3, 700, 700, 'hour', 12*24),
+    (0.05, 2000, 50, 'hour', 12*24),
+    (0.1, 2000, 2000, 'second', 2*24*3600),
+    (0.05, 2000, 50, 'second', 2*24*3600),
+]
+
+
+@pytest.mark.parametrize('plc_cls,name', [(policy_dyna, 'DynaES'), (policy_adap, 'ES-Adap')])
+@pytest.mark.parametrize('dc_alpha,capacity,soc,resolution,duration', cases)
+def test_event_driven_matches_per_step(tmp_path, plc_cls, name, dc_alpha, capacity, soc, resolution, duration):
+    step, step_profile, step_batt = run(tmp_path, plc_cls, name, dc_alpha, capacity, soc, resolution, duration, False)
+    event, event_profile, event_batt = run(tmp_path, plc_cls, name, dc_alpha, capacity, soc, resolution, duration, True)
+
+    socs = ['start_soc', 'end_soc']
+    assert step.drop(columns=socs).astype(str).equals(event.drop(columns=socs).astype(str))
+    for c in socs:
+        np.testing.assert_allclose(pd.to_numeric(step[c]).fillna(-1), pd.to_numeric(event[c]).fillna(-1), rtol=1e-9, atol=1e-6)
+    assert step_profile == event_profile
+    assert event_batt.soc == pytest.approx(step_batt.soc, rel=1e-9, abs=1e-6)
+    assert event_batt.clipped == pytest.approx(step_batt.clipped, rel=1e-9, abs=1e-6)
+    if 50 == soc:
+        assert any('soc not enough' in info for info in step['info'])
@@ -0,0 +1,69 @@
+"""
+The blended prediction a decision reads must not depend on actuals after the decision time.
+"""
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from simulator.EnergySim import Simulator
+from simulator.Timer import Timer
+from simulator.trace import Trace
+from simulator.estimator import EnsembleEstimator
+
+energy_pred_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'DC_pred.csv')
+
+
+def blend(trace, estimator):
+    simul = Simulator(Timer(pd.Timestamp('2017-06-12')), None, 0.1, 'dc_actual', 'dc_pred_rf', trace=trace, estimator=estimator)
+    return np.asarray(simul.column(simul.energy_pred_col)), simul
+
+
+def later_actuals_changed(trace, r, rng):
+    # copy of the trace with the actuals of rows >= r replaced
+    data = {c: np.array(v, dtype=float) for c, v in trace.data.items()}
+    data['dc_actual'][r:] = rng.uniform(0, 2 * data['dc_actual'].max(), len(trace.time) - r)
+    return Trace(trace.time.copy(), data)
+
+
+def test_decision_rows_use_past_actuals_only():
+    rng = np.random.default_rng(0)
+    trace = Trace.from_csv(energy_pred_path)
+    base, simul = blend(trace, EnsembleEstimator(window=24))
+    lead = -(-simul.window // simul.step)                  # rows a decision reads ahead
+    for r in rng.integers(1, len(trace.time) - 1, 20):
+        other, _ = blend(later_actuals_changed(trace, r, rng), EnsembleEstimator(window=24))
+        assert np.array_equal(base[:r + lead + 1], other[:r + lead + 1])
+
+
+def test_unlagged_fit_reads_later_actuals():
+    # the property above does not hold by chance: a lag of 0 lets the next rows' blend move
+    rng = np.random.default_rng(1)
+    trace = Trace.from_csv(energy_pred_path)
+    r = len(trace.time) // 2
+    base = EnsembleEstimator(window=24).fit(trace, lag=0).copy()
+    other = EnsembleEstimator(window=24).fit(later_actuals_changed(trace, r, rng), lag=0)
+    assert np.array_equal(base[:r + 1], other[:r + 1])
+    assert not np.array_equal(base[r + 1:r + 73], other[r + 1:r + 73])
+
+
+def test_members_per_trace():
+    # one estimator fitted on traces with different prediction columns blends the columns of each
+    trace = Trace.from_csv(energy_pred_path)
+    preds = [c for c in trace.columns if c.startswith('dc_pred_')]
+    fewer = Trace(trace.time.copy(), {c: v for c, v in trace.data.items() if c != preds[-1]})
+    est = EnsembleEstimator(window=24)
+    est.fit(trace)
+    assert est.member_cols(trace) == preds
+    assert est.member_cols(fewer) == preds[:-1]
+    est.fit(fewer)
+    assert est.weights_.shape[1] == len(preds) - 1
+
+    # the blend is not a member of the next fit
+    assert est.member_cols(trace) == preds
+    assert np.array_equal(est.fit(trace, lag=5), EnsembleEstimator(window=24).fit(Trace.from_csv(energy_pred_path), lag=5))
+
+
+def test_missing_members():
+    trace = Trace.from_csv(energy_pred_path)
+    with pytest.raises(ValueError, match='dc_pred_none'):
+        EnsembleEstimator(members=['dc_pred_rf', 'dc_pred_none']).fit(trace)
@@ -0,0 +1,48 @@
+"""
+FleetScheduler against Scheduler: a fleet of identical nodes runs each node exactly as the per-node controller does.
+"""
+import os, json, shutil, contextlib, io
+import numpy as np
+import pandas as pd
+import pytest
+from simulator.EnergySim import Simulator
+from simulator.Timer import Timer
+from simulator.Battery import Battery, FleetBattery
+from simulator.trace import Trace
+from scheduler.controller import Scheduler
+from scheduler.fleet import FleetScheduler, FleetSensors
+from scheduler.policy.policy_adap import Policy as policy_adap
+from scheduler.policy.policy_dyna import Policy as policy_dyna
+
+data = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+energy_pred_path = os.path.join(data, 'DC_pred.csv')
+
+
+@pytest.mark.parametrize('plc_cls,name', [(policy_dyna, 'DynaES'), (policy_adap, 'ES-Adap')])
+@pytest.mark.parametrize('dc_alpha', [0.05, 0.1, 0.3])
+@pytest.mark.parametrize('n', [1, 3])
+def test_fleet_matches_scheduler(tmp_path, plc_cls, name, dc_alpha, n):
+    trace = Trace.from_csv(energy_pred_path)
+    sensor_path = shutil.copy(os.path.join(data, 'sensor_profile.json'), str(tmp_path / 'sensor_profile.json'))
+    with open(sensor_path, 'r') as f:
+        profile = json.load(f)
+
+    simul = Simulator(Timer(pd.Timestamp('2017-06-12')), None, dc_alpha, 'dc_actual', 'dc_pred_rf', trace=trace)
+    batt = Battery(soc=2000, capacity=2000, mini=400, standby=24*30*3600, base_consume=30)
+    sch = Scheduler(simulator=simul, resolution='hour', duration=12*24, policy=plc_cls(name), sensor_path=sensor_path, sch_path=None, battery=batt)
+    with contextlib.redirect_stdout(io.StringIO()):         # policy warnings
+        sch.start()
+    log = sch.sch.to_df()
+    log = log[log.exed == True]
+
+    simul = Simulator(Timer(pd.Timestamp('2017-06-12')), None, dc_alpha, 'dc_actual', 'dc_pred_rf', trace=trace)
+    fb = FleetBattery(soc=2000, capacity=2000, mini=400, standby=24*30*3600, base_consume=30, n=n)
+    fleet = FleetScheduler(simul, FleetSensors.from_profiles([profile] * n), fb, plc_cls(name), duration=12*24)
+    summary = fleet.start()
+    assert np.array_equal(summary.final_soc.to_numpy(), np.full(n, batt.soc))
+    flogs = fleet.to_df()
+    for node in range(n):
+        flog = flogs[flogs.node == node]
+        assert list(flog.exe_time) == list(log.exe_time)
+        assert [sorted(s) for s in flog.sensors] == [sorted(s) for s in log.sensors]
+        assert np.array_equal(flog.end_soc.to_numpy(dtype=float), log.end_soc.to_numpy(dtype=float))
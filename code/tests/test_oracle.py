@@ -0,0 +1,67 @@
+"""
+Offline oracle: bounded plan memory and trace steps it accepts.
+"""
+import os, shutil, json
+import numpy as np
+import pandas as pd
+import pytest
+from simulator.EnergySim import Simulator
+from simulator.Timer import Timer
+from simulator.Battery import Battery
+from simulator.trace import Trace
+from scheduler.controller import Scheduler
+from scheduler.sensors import SensorStore
+from scheduler.policy.policy_oracle import Policy
+
+data = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+trace = Trace.from_csv(os.path.join(data, 'DC_pred.csv'))
+with open(os.path.join(data, 'sensor_profile.json'), 'r') as f:
+    profile = SensorStore.from_dict(json.load(f))
+
+
+def decide(plc, simul, scale=0.1):
+    return plc.decide(simul, simul.timer.now, 1500.0, 2000.0, 400.0, 0.0, 30.0, profile.consum.astype(float),
+                      profile.ideal_interval, np.full(len(profile.names), simul.timer.now), scale)
+
+
+def test_plans_bounded(tmp_path):
+    # passed rows are dropped from the plan as the run goes on
+    sensor_path = shutil.copy(os.path.join(data, 'sensor_profile.json'), str(tmp_path / 'sensor_profile.json'))
+    simul = Simulator(Timer(pd.Timestamp('2017-06-12')), None, 0.1, 'dc_actual', 'dc_pred_rf', trace=trace)
+    plc = Policy('Oracle')
+    sch = Scheduler(simul, sensor_path, None, Battery(soc=2000, capacity=2000, mini=400, standby=24*30*3600, base_consume=30),
+                    plc, duration=12*24, resolution='hour')
+    sch.start()
+    p, = plc.plans.values()
+    assert p['t0'] > len(trace) // 2
+    assert len(p['V']) == p['t1'] - p['t0'] + 1 and len(p['gains']) == p['t1'] - p['t0']
+
+    # one plan per node setting, the least recently used dropped first
+    plc = Policy('Oracle', horizon=48, max_plans=3)
+    simul = Simulator(Timer(pd.Timestamp('2017-06-14')), None, 0.1, 'dc_actual', 'dc_pred_rf', trace=trace)
+    first = decide(plc, simul, 0.05)
+    for scale in [0.1, 0.2, 0.3, 0.05]:
+        decide(plc, simul, scale)
+    assert len(plc.plans) == 3
+    assert [k[2] for k in plc.plans] == [0.2, 0.3, 0.05]
+    again = decide(plc, simul, 0.05)
+    assert first[0] == again[0] and np.array_equal(first[1], again[1])
+
+
+@pytest.mark.parametrize('step', [420, 7200])
+def test_trace_step_must_divide_an_hour(step):
+    t = Trace(trace.time[0] + step * np.arange(len(trace)), trace.data)
+    simul = Simulator(Timer(int(t.time[0])), None, 0.1, 'dc_actual', 'dc_pred_rf', trace=t)
+    with pytest.raises(ValueError, match='divide an hour'):
+        decide(Policy('Oracle', horizon=48), simul)
+
+
+def test_half_hour_trace():
+    # a half-hour trace is accepted, gaps and ideal intervals are both counted in its rows
+    t = Trace(trace.time[0] + 1800 * np.arange(2 * len(trace)), {c: np.repeat(v, 2) / 2 for c, v in trace.data.items()})
+    simul = Simulator(Timer(int(t.time[0]) + 2*24*3600), None, 0.1, 'dc_actual', 'dc_pred_rf', trace=t)
+    plc = Policy('Oracle', horizon=96)
+    steps, mask = decide(plc, simul)
+    p, = plc.plans.values()
+    assert list(p['ideal']) == sorted(set(2 * profile.ideal_interval.astype(int)))
+    assert steps >= 1 and mask.shape == (len(profile.names),)
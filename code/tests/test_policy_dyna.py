@@ -0,0 +1,66 @@
+"""
+The array kernel of policy_dyna.Policy.run against the baseline loop implementation (policy_dyna_loop.py):
+same {'time', 'sensors'} on seeded random states at both resolutions.
+"""
+import os, io, contextlib
+import numpy as np
+import pandas as pd
+import pytest
+from simulator.EnergySim import Simulator
+from simulator.Timer import Timer
+from simulator.Battery import Battery
+from scheduler.policy.policy_dyna import Policy
+import policy_dyna_loop
+
+energy_pred_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'DC_pred.csv')
+start = pd.Timestamp('2017-06-12')
+names = ['a', 'b', 'c', 'd', 'e']
+
+
+def random_state(rng, resolution, case):
+    """
+    Simulator, battery and sensor profile of one random state.
+    case: 'random'; 'low_gain': predicted energy + soc under mini (sleep 3 days); 'low_soc': soc under mini - 1
+    """
+    timer = Timer(start)
+    alpha = {'random': rng.choice([0.01, 0.05, 0.1, 0.3, 1.0]), 'low_gain': 0.0, 'low_soc': rng.choice([0.05, 0.1, 0.3])}[case]
+    simul = Simulator(timer, energy_pred_path, alpha, 'dc_actual', rng.choice(['dc_pred_rf', 'dc_pred_svr', 'dc_pred_lin']))
+    step = 3600 if 'hour' == resolution else int(rng.integers(1, 3600))
+    timer.curr_time = start + pd.Timedelta(seconds=int(rng.integers(0, 13*24*3600 // step)) * step)
+    soc = rng.uniform(0, 2000) if 'random' == case else rng.uniform(0, 399)
+    batt = Battery(soc=soc, capacity=2000, mini=400, standby=24*30*3600, base_consume=30)
+    profile = {s: {'consum': int(rng.choice([10, 20, 40, 60])), 'ideal_interval': int(rng.choice([1, 2, 3, 6])),
+                   'last_used_time': '2017-06-12T00:00:00', 'time_gap': 1.0,
+                   'priority': float(rng.uniform(0.1, 20)) if rng.random() < 0.7 else float(rng.integers(1, 10))}
+               for s in names[:rng.integers(1, len(names) + 1)]}
+    return timer, batt, profile, simul
+
+
+@pytest.mark.parametrize('resolution,case,n', [('hour', 'random', 300), ('hour', 'low_gain', 20), ('hour', 'low_soc', 50),
+                                               ('second', 'random', 30), ('second', 'low_gain', 5), ('second', 'low_soc', 10)])
+def test_same_decisions(resolution, case, n):
+    rng = np.random.default_rng([0, len(resolution), len(case)])
+    for _ in range(n):
+        timer, batt, profile, simul = random_state(rng, resolution, case)
+        with contextlib.redirect_stdout(io.StringIO()):         # policy warnings
+            ref = policy_dyna_loop.Policy('DynaES').run(timer, batt, profile, simul, resolution, None)
+            new = Policy('DynaES').run(timer, batt, profile, simul, resolution, None)
+        assert {'time': new['time'], 'sensors': new['sensors']} == {'time': ref['time'], 'sensors': ref['sensors']}
+        if 'low_gain' == case:
+            assert [] == ref['sensors']
+
+
+def test_horizon_within_window():
+    # a horizon past the prediction window raises; a longer window lets it take effect
+    timer = Timer(start + pd.Timedelta(hours=6))
+    profile = {'a': {'consum': 60, 'ideal_interval': 1, 'last_used_time': '2017-06-12T00:00:00', 'time_gap': 1.0, 'priority': 1.0}}
+    times = {}
+    for horizon in [120, 240]:
+        simul = Simulator(timer, energy_pred_path, 0.02, 'dc_actual', 'dc_pred_rf', window=11*24*3600)
+        batt = Battery(soc=300, capacity=2000, mini=400, standby=24*30*3600, base_consume=30)
+        times[horizon] = Policy('DynaES', horizon=horizon).run(timer, batt, dict(profile), simul, 'hour', None)['time']
+    assert times[120] != times[240]
+    simul = Simulator(timer, energy_pred_path, 0.02, 'dc_actual', 'dc_pred_rf')
+    batt = Battery(soc=300, capacity=2000, mini=400, standby=24*30*3600, base_consume=30)
+    with pytest.raises(ValueError):
+        Policy('DynaES', horizon=240).run(timer, batt, dict(profile), simul, 'hour', None)
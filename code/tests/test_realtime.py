@@ -0,0 +1,63 @@
+"""
+The real-time loop on its stand-in node (SimulatedSource + AcceleratedClock) against the event-driven Scheduler:
+same sensing events over 12 days.
+"""
+import os, json, shutil, tempfile, asyncio, contextlib, io
+import pandas as pd
+import pytest
+from simulator.EnergySim import Simulator
+from simulator.Timer import Timer, to_epoch
+from simulator.Battery import Battery
+from scheduler.controller import Scheduler
+from scheduler import runtime
+from scheduler.realtime import RealtimeController, EnergySource
+from scheduler.policy.policy_adap import Policy as policy_adap
+from scheduler.policy.policy_dyna import Policy as policy_dyna
+
+data = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+energy_pred_path = os.path.join(data, 'DC_pred.csv')
+
+
+def test_energy_source_is_abstract():
+    with pytest.raises(TypeError):
+        EnergySource()
+
+
+@pytest.mark.parametrize('policy,plc_cls,name', [('policy_dyna', policy_dyna, 'DynaES'), ('policy_adap', policy_adap, 'ES-Adap')])
+def test_standin_matches_scheduler(tmp_path, policy, plc_cls, name):
+    sensor_path = shutil.copy(os.path.join(data, 'sensor_profile.json'), str(tmp_path / 'sensor_profile.json'))
+    standin_path = shutil.copy(sensor_path, str(tmp_path / 'standin_profile.json'))
+
+    simul = Simulator(Timer(pd.Timestamp('2017-06-12')), energy_pred_path, 0.1, 'dc_actual', 'dc_pred_rf')
+    batt = Battery(soc=2000, capacity=2000, mini=400, standby=24*30*3600, base_consume=30)
+    sch = Scheduler(simul, sensor_path, None, batt, plc_cls(name), duration=12*24, resolution='hour', event_driven=True)
+    with contextlib.redirect_stdout(io.StringIO()):         # policy warnings
+        sch.start()
+    log = sch.sch.to_df()
+    log = log[log.exed == True]
+    expected = [(to_epoch(t) - 1, list(s)) for t, s in zip(log.exe_time, log.sensors)]
+
+    ctl = RealtimeController.standin(energy_pred_path, standin_path, policy=policy, speed=1e7)
+    with contextlib.redirect_stdout(io.StringIO()):
+        events = asyncio.run(ctl.run(until=to_epoch(sch.simul_end_time)))
+    assert len(expected) > 0
+    assert [(e['time'], e['sensors']) for e in events] == expected
+    assert all(e['readings'] == {s: s for s in e['sensors']} for e in events)
+
+
+def test_standin_state_path(tmp_path, monkeypatch):
+    # with a state_path the node's state is kept there; without one nothing is left on disk
+    sensor_path = shutil.copy(os.path.join(data, 'sensor_profile.json'), str(tmp_path / 'sensor_profile.json'))
+    state_path = str(tmp_path / 'state.json')
+    ctl = RealtimeController.standin(energy_pred_path, sensor_path, state_path=state_path)
+    with contextlib.redirect_stdout(io.StringIO()):
+        asyncio.run(ctl.run(max_wakes=5))
+    assert runtime.load_state(state_path) == json.loads(json.dumps(ctl.runtime.to_state()))
+
+    tmp = tmp_path / 'tmp'
+    tmp.mkdir()
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp))
+    ctl = RealtimeController.standin(energy_pred_path, sensor_path)
+    with contextlib.redirect_stdout(io.StringIO()):
+        asyncio.run(ctl.run(max_wakes=5))
+    assert ctl.writer.state_path is None and [] == os.listdir(str(tmp))
@@ -0,0 +1,51 @@
+"""
+Robust DynaES (EnergyScenarios) against the point forecast, and reproducible sampling.
+"""
+import os, io, contextlib
+import numpy as np
+import pandas as pd
+import pytest
+from simulator.EnergySim import Simulator
+from simulator.Timer import Timer
+from simulator.estimator import EnsembleEstimator
+from simulator.scenarios import EnergyScenarios
+from scheduler.policy.policy_dyna import Policy
+from test_policy_dyna import random_state
+
+energy_pred_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'DC_pred.csv')
+
+
+@pytest.mark.parametrize('resolution,case,n', [('hour', 'random', 200), ('hour', 'low_soc', 30), ('second', 'random', 30)])
+def test_zero_spread_matches_point(resolution, case, n):
+    # one member: no spread, every trajectory is the forecast itself
+    rng = np.random.default_rng([1, len(resolution), len(case)])
+    for _ in range(n):
+        timer, batt, profile, simul = random_state(rng, resolution, case)
+        scenarios = EnergyScenarios(members=[simul.energy_pred_col], samples=50)
+        with contextlib.redirect_stdout(io.StringIO()):         # policy warnings
+            point = Policy('DynaES').run(timer, batt, profile, simul, resolution, None)
+            robust = Policy('DynaES', scenarios=scenarios).run(timer, batt, profile, simul, resolution, None)
+        assert (robust['time'], robust['sensors']) == (point['time'], point['sensors'])
+
+
+def test_residual_bootstrap_seeded():
+    simul = Simulator(Timer(pd.Timestamp('2017-06-12')), energy_pred_path, 0.1, 'dc_actual', 'dc_pred_rf')
+    g0, n = 10*24 + 5, 72
+    draw = lambda seed: EnergyScenarios('residuals', samples=200, seed=seed).sample(simul, 'dc_pred_rf', 'hour', g0, n)
+
+    bounds, cum = draw(7)
+    again = EnergyScenarios('residuals', samples=200, seed=7)
+    for _ in range(2):                                          # same days for a new instance and on every call
+        b, c = again.sample(simul, 'dc_pred_rf', 'hour', g0, n)
+        assert np.array_equal(bounds, b) and np.array_equal(cum, c)
+    assert not np.array_equal(cum, draw(8)[1])
+    assert np.unique(cum[:, -1]).size > 1                       # several days drawn
+
+
+def test_members_skip_derived_columns():
+    trace_cols = Simulator(Timer(pd.Timestamp('2017-06-12')), energy_pred_path, 0.1, 'dc_actual', 'dc_pred_rf').trace.columns
+    simul = Simulator(Timer(pd.Timestamp('2017-06-12')), energy_pred_path, 0.1, 'dc_actual', 'dc_pred_rf', estimator=EnsembleEstimator())
+    assert 'dc_pred_ens' in simul.trace.columns
+    assert EnergyScenarios().member_cols(simul) == [c for c in trace_cols if c.startswith('dc_pred_')]
+    with pytest.raises(ValueError, match='dc_pred_none'):
+        EnergyScenarios(members=['dc_pred_rf', 'dc_pred_none']).member_cols(simul)
@@ -0,0 +1,77 @@
+"""
+SchLog files: csv and binary logs read back the rows of the in-memory log, whatever the flush batches,
+and a run resumed from a binary log (tail row only) continues as the uninterrupted run.
+"""
+import os, shutil, contextlib, io
+import pandas as pd
+import pytest
+from simulator.EnergySim import Simulator
+from simulator.Timer import Timer
+from simulator.Battery import Battery
+from simulator.trace import Trace
+from scheduler.controller import Scheduler
+from scheduler.schlog import SchLog
+from scheduler.policy.policy_adap import Policy as policy_adap
+from scheduler.policy.policy_dyna import Policy as policy_dyna
+
+data = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+energy_pred_path = os.path.join(data, 'DC_pred.csv')
+trace = Trace.from_csv(energy_pred_path)
+
+
+def run(sensor_path, sch_path, policy, start, duration, soc=2000, resolution='hour', flush_every=None):
+    simul = Simulator(Timer(start), None, 0.1, 'dc_actual', 'dc_pred_rf', trace=trace)
+    batt = Battery(soc=soc, capacity=2000, mini=400, standby=24*30*3600, base_consume=30)
+    sch = Scheduler(simulator=simul, resolution=resolution, duration=duration, policy=policy, sensor_path=sensor_path,
+                    sch_path=sch_path, battery=batt, flush_every=flush_every)
+    with contextlib.redirect_stdout(io.StringIO()):         # policy warnings
+        sch.start()
+    return sch, batt
+
+
+def profile(tmp_path, name='sensor_profile.json'):
+    return shutil.copy(os.path.join(data, 'sensor_profile.json'), str(tmp_path / name))
+
+
+@pytest.mark.parametrize('suffix', ['.csv', '.bin'])
+@pytest.mark.parametrize('flush_every', [None, 1, 7])
+@pytest.mark.parametrize('plc_cls,name', [(policy_dyna, 'DynaES'), (policy_adap, 'ES-Adap')])
+def test_round_trip(tmp_path, suffix, flush_every, plc_cls, name):
+    sch_path = str(tmp_path / ('sch' + suffix))
+    sch, _ = run(profile(tmp_path), sch_path, plc_cls(name), pd.Timestamp('2017-06-12'), 4*24, flush_every=flush_every)
+    expected = sch.sch.to_df()
+    assert len(expected) > 10
+
+    log = SchLog.load(sch_path, sch.sch_columns, tail=False)
+    assert expected.astype(str).equals(log.to_df().astype(str))
+
+    # legacy csv export of either format reads back the same rows
+    csv_path = str(tmp_path / 'export.csv')
+    log.export_csv(csv_path)
+    assert expected.astype(str).equals(SchLog.load(csv_path, sch.sch_columns).to_df().astype(str))
+
+
+def test_binary_tail_load(tmp_path):
+    sch_path = str(tmp_path / 'sch')
+    sch, _ = run(profile(tmp_path), sch_path, policy_dyna('DynaES'), pd.Timestamp('2017-06-12'), 2*24, flush_every=3)
+    log = SchLog.load(sch_path, sch.sch_columns)
+    assert 1 == log.n and log.offset == len(sch.sch) - 1
+    assert str(log.tail()) == str(sch.sch.tail())
+
+
+@pytest.mark.parametrize('flush_every', [None, 5])
+@pytest.mark.parametrize('plc_cls,name', [(policy_dyna, 'DynaES'), (policy_adap, 'ES-Adap')])
+def test_resume_binary(tmp_path, flush_every, plc_cls, name):
+    # uninterrupted run
+    full, full_batt = run(profile(tmp_path, 'full_profile.json'), str(tmp_path / 'full'), plc_cls(name), pd.Timestamp('2017-06-12'), 6*24, flush_every=flush_every)
+
+    # the same run in two parts: the second one resumes the binary log and the sensor profile left by the first
+    sensor_path, sch_path = profile(tmp_path, 'parts_profile.json'), str(tmp_path / 'parts')
+    first, batt = run(sensor_path, sch_path, plc_cls(name), pd.Timestamp('2017-06-12'), 3*24, flush_every=flush_every)
+    second, second_batt = run(sensor_path, sch_path, plc_cls(name), first.timer.now, 6*24 - 3*24 - 1, soc=batt.soc, flush_every=flush_every)
+    assert second.sch.offset == len(first.sch) - 1           # resumed from the tail row only
+
+    expected = SchLog.load(str(tmp_path / 'full'), full.sch_columns, tail=False).to_df()
+    resumed = SchLog.load(sch_path, full.sch_columns, tail=False).to_df()
+    assert expected.astype(str).equals(resumed.astype(str))
+    assert second_batt.soc == pytest.approx(full_batt.soc, rel=1e-12)
@@ -0,0 +1,74 @@
+"""
+Forks: a branch taken mid-run continues exactly as the uninterrupted run, and running it leaves the parent unchanged.
+"""
+import os, shutil, contextlib, io
+import numpy as np
+import pandas as pd
+import pytest
+from simulator.EnergySim import Simulator
+from simulator.Timer import Timer
+from simulator.Battery import Battery
+from simulator.trace import Trace
+from scheduler.controller import Scheduler
+from scheduler.policy.policy_adap import Policy as policy_adap
+from scheduler.policy.policy_dyna import Policy as policy_dyna
+
+data = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+trace = Trace.from_csv(os.path.join(data, 'DC_pred.csv'))
+
+
+def scheduler(tmp_path, name, plc, resolution, duration, event_driven):
+    sensor_path = shutil.copy(os.path.join(data, 'sensor_profile.json'), str(tmp_path / (name + '.json')))
+    simul = Simulator(Timer(pd.Timestamp('2017-06-12')), None, 0.1, 'dc_actual', 'dc_pred_rf', trace=trace)
+    batt = Battery(soc=2000, capacity=2000, mini=400, standby=24*30*3600, base_consume=30)
+    return Scheduler(simul, sensor_path, None, batt, plc, duration=duration, resolution=resolution, event_driven=event_driven)
+
+
+def start(sch):
+    with contextlib.redirect_stdout(io.StringIO()):         # policy warnings
+        sch.start()
+    return sch
+
+
+def state(sch):
+    # everything a later step reads
+    return sch.sch.to_df().to_csv(), sch.batt.soc, sch.batt.clipped, sch.timer.now, sch.steps, str(sch.sensors.to_dict())
+
+
+def same_log(a, b, exact):
+    a, b = a.sch.to_df(), b.sch.to_df()
+    socs = ['start_soc', 'end_soc']
+    assert a.drop(columns=socs).astype(str).equals(b.drop(columns=socs).astype(str))
+    if exact:
+        assert a[socs].astype(str).equals(b[socs].astype(str))
+    for c in socs:
+        np.testing.assert_allclose(pd.to_numeric(a[c]).fillna(-1), pd.to_numeric(b[c]).fillna(-1), rtol=1e-9, atol=1e-6)
+
+
+@pytest.mark.parametrize('plc_cls,name', [(policy_dyna, 'DynaES'), (policy_adap, 'ES-Adap')])
+@pytest.mark.parametrize('resolution,fork_at,duration,event_driven', [
+    ('hour', 6*24, 12*24, False),
+    ('hour', 6*24, 12*24, True),           # jump() projects over other blocks: socs equal to rounding
+    ('second', 5000, 12000, False),
+])
+def test_fork_continues_run(tmp_path, plc_cls, name, resolution, fork_at, duration, event_driven):
+    full = start(scheduler(tmp_path, 'full', plc_cls(name), resolution, duration, event_driven))
+
+    parent = start(scheduler(tmp_path, 'parent', plc_cls(name), resolution, fork_at, event_driven))
+    before = state(parent)
+    snap = parent.snapshot()
+    forks = [start(snap.fork(duration=duration)) for _ in range(2)]
+    assert parent.timer.now < full.timer.now and 0 < parent.steps
+
+    for b in forks:
+        same_log(full, b, not event_driven)
+        assert b.batt.soc == pytest.approx(full.batt.soc, rel=1e-9, abs=1e-6)
+        assert b.timer.now == full.timer.now
+        assert str(b.sensors.to_dict()) == str(full.sensors.to_dict())
+    assert state(forks[0]) == state(forks[1])
+    assert state(parent) == before
+
+    # running the forks changed nothing the parent reads: it continues as the uninterrupted run as well
+    parent.end = parent.simul_end(parent.resolution, duration)
+    same_log(full, start(parent), not event_driven)
+    assert parent.batt.soc == pytest.approx(full.batt.soc, rel=1e-9, abs=1e-6)